@@ -0,0 +1,85 @@
+import sys
+import random
+import argparse
+import numpy as np
+from evaluation import MIDGAME_PIECE_SQUARE_SCORES, ENDGAME_PIECE_SQUARE_SCORES, CENTIPAWNS, PHASE_WEIGHTS, MAX_PHASE, evaluate_pawn_structure
+from mychess import Chess, Position, PAWN_WHITE, PAWN_BLACK
+from engine import Engine
+
+PARITY_START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+PARITY_MAX_PLIES = 80 # Random games of the parity check stop after up to this many moves
+
+MIDGAME_WEIGHTS = np.array(MIDGAME_PIECE_SQUARE_SCORES, dtype = np.int64) # (12, 64), piece code by square index, centipawns from white's point of view
+ENDGAME_WEIGHTS = np.array(ENDGAME_PIECE_SQUARE_SCORES, dtype = np.int64)
+PHASE_WEIGHTS_BY_SQUARE = np.repeat(np.array(PHASE_WEIGHTS, dtype = np.int64)[:, None], 64, axis = 1) # (12, 64), the phase weight of each piece on every square
+
+def positions_to_bitboards(positions): # (N, 12) array of the bitboards of Position objects
+    return np.array([position.bitboards for position in positions], dtype = np.uint64)
+
+def unpack_bitboards(bitboards): # (N, 12, 64) array of 0 and 1, bit i of a bitboard lands on square index i
+    bitboard_bytes = np.ascontiguousarray(bitboards, dtype = "<u8").view(np.uint8).reshape(len(bitboards), 12, 8)
+    return np.unpackbits(bitboard_bytes, axis = 2, bitorder = "little")
+
+def piece_square_scores(bitboards): # Midgame score, endgame score and phase per position, the same integers the positions keep incrementally
+    squares = unpack_bitboards(bitboards).reshape(len(bitboards), 12 * 64)
+    return squares @ MIDGAME_WEIGHTS.reshape(12 * 64), squares @ ENDGAME_WEIGHTS.reshape(12 * 64), squares @ PHASE_WEIGHTS_BY_SQUARE.reshape(12 * 64)
+
+def pawn_structure_scores(bitboards, pawn_hash_table = None): # Midgame and endgame pawn terms per position, computed once per distinct pawn structure
+    pawn_structures, structure_indices = np.unique(bitboards[:, [PAWN_WHITE, PAWN_BLACK]], axis = 0, return_inverse = True)
+    scores = np.zeros((len(pawn_structures), 2), dtype = np.int64)
+    for index, (white_pawns, black_pawns) in enumerate(pawn_structures):
+        key = (int(white_pawns), int(black_pawns))
+        entry = pawn_hash_table.get(key) if pawn_hash_table is not None else None
+        if entry is None:
+            entry = evaluate_pawn_structure(*key)
+            if pawn_hash_table is not None:
+                pawn_hash_table.put(key, entry)
+        scores[index] = entry[:2]
+    structure_indices = structure_indices.reshape(-1)
+    return scores[structure_indices, 0], scores[structure_indices, 1]
+
+def evaluate_batch(bitboards, engine_color, pawn_hash_table = None): # Engine.static_evaluation of N positions in pawns, Engine.evaluate adds the check terms on top since they need move generation
+    midgame_scores, endgame_scores, phases = piece_square_scores(bitboards)
+    pawn_midgame_scores, pawn_endgame_scores = pawn_structure_scores(bitboards, pawn_hash_table)
+    midgame_scores = midgame_scores + pawn_midgame_scores
+    endgame_scores = endgame_scores + pawn_endgame_scores
+    phases = np.minimum(phases, MAX_PHASE)
+    scores = (midgame_scores * phases + endgame_scores * (MAX_PHASE - phases)) // MAX_PHASE # Floor division like tapered_score
+    if engine_color != "WHITE":
+        scores = -scores
+    return scores / CENTIPAWNS # Same division of the same integers as the scalar evaluator, so the floats are identical
+
+def random_positions(chess, count, max_plies = PARITY_MAX_PLIES): # Positions reached by random legal moves from the start position
+    positions = []
+    while len(positions) < count:
+        board_matrix = Position.from_fen(PARITY_START_FEN)
+        for _ in range(random.randint(1, max_plies)):
+            moves = chess.generate_moves(board_matrix, "WHITE" if board_matrix.white_turn else "BLACK")
+            if not moves:
+                break
+            chess.make_move(board_matrix, random.choice(moves))
+        positions.append(board_matrix)
+    return positions
+
+def parity_mismatches(positions, engine): # Indices of the positions where evaluate_batch differs from Engine.static_evaluation
+    batch_scores = evaluate_batch(positions_to_bitboards(positions), engine.engine_color)
+    return [index for index, board_matrix in enumerate(positions) if batch_scores[index] != engine.static_evaluation(board_matrix, engine.engine_color) / CENTIPAWNS]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Compare the batch evaluator with Engine.static_evaluation on positions reached by random moves.")
+    parser.add_argument("--positions", type = int, default = 300, help = "Number of random positions")
+    parser.add_argument("--seed", type = int, default = 0, help = "Seed of the random games")
+    args = parser.parse_args()
+    
+    random.seed(args.seed)
+    chess = Chess(None)
+    positions = random_positions(chess, args.positions)
+    failures = 0
+    for player_color in ("BLACK", "WHITE"): # Scores from the point of view of both engine colors
+        engine = Engine(chess, player_color, time_limit = None)
+        mismatches = parity_mismatches(positions, engine)
+        for index in mismatches:
+            print(f"position {index}, {engine.engine_color}: batch differs from the static evaluation")
+        failures += len(mismatches)
+    print(f"{failures} mismatching scores out of {2 * len(positions)}")
+    sys.exit(1 if failures else 0)
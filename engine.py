@@ -2,166 +2,543 @@ import time
 import os
 import json
 import random
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from transposition import TranspositionTable, SharedTranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND
+from evaluation import PAWN_VALUE, ROOK_VALUE, KNIGHT_VALUE, BISHOP_VALUE, QUEEN_VALUE, CENTIPAWNS, tapered_score, evaluate_pawn_structure
+from mychess import Chess, LRUCache, COLOR_CODES, MOVE_CAPTURE, MOVE_EN_PASSANT, MOVE_PROMOTION, PAWN_BLACK, PAWN_WHITE, KING_BLACK
 
 OPENING_MOVES_JSON_RELATIVE_PATH = "move_archive/openings.json"
 
-PAWN_VALUE = 1
-BISHOP_VALUE = 3
-KNIGHT_VALUE = 3
-ROOK_VALUE = 5
-QUEEN_VALUE = 7
-
 IN_CHECK_BONUS = 1.5
 
 OPENING_THRESHOLD = 10
-ENDGAME_THRESHOLD = 60
 
-KNIGHT_POS_BONUS = [-0.5,-0.4, -0.2, -0.1, -0.1, -0.2, -0.4, -0.5, -0.4, -0.2, -0.1, 0.1, 0.1, -0.1, -0.2, -0.4, -0.2, -0.1, 0.1, 0.3, 0.3, 0.1, -0.1, -0.2, -0.1, 0.1, 0.3, 0.5, 0.5, 0.3, 0.1, -0.1, -0.1, 0.1, 0.3, 0.5, 0.5, 0.3, 0.1, -0.1, -0.2, -0.1, 0.1, 0.3, 0.3, 0.1, -0.1, -0.2, -0.4, -0.2, -0.1, 0.1, 0.1, -0.1, -0.2, -0.4, -0.5, -0.4, -0.2, -0.1, -0.1, -0.2, -0.4, -0.5]
-BISHOP_POS_BONUS = [-0.2, -0.1, 0, 0.1, 0.1, 0, -0.1, -0.2, -0.1, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, -0.1, 0, 0.2, 0.4, 0.4, 0.4, 0.4, 0.2, 0, 0.1, 0.3, 0.4, 0.5, 0.5, 0.4, 0.3, 0.1, 0.1, 0.3, 0.4, 0.5, 0.5, 0.4, 0.3, 0.1, 0, 0.2, 0.4, 0.4, 0.4, 0.4, 0.2, 0, -0.1, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, -0.1, -0.2, -0.1, 0, 0.1, 0.1, 0, -0.1, -0.2]
-QUEEN_POS_BONUS = [-0.4, -0.2, 0, 0.2, 0.2, 0, -0.2, -0.4, -0.2, 0, 0.2, 0.4, 0.4, 0.2, 0, -0.2, 0, 0.2, 0.4, 0.5, 0.5, 0.4, 0.2, 0, 0.2, 0.4, 0.5, 0.6, 0.6, 0.5, 0.4, 0.2, 0.2, 0.4, 0.5, 0.6, 0.6, 0.5, 0.4, 0.2, 0, 0.2, 0.4, 0.5, 0.5, 0.4, 0.2, 0, -0.2, 0, 0.2, 0.4, 0.4, 0.2, 0, -0.2, -0.4, -0.2, 0, 0.2, 0.2, 0, -0.2, -0.4]
-PAWN_START_POS_BONUS = [0, 0, 0, 0, 0, 0, 0, 0, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.2, 0.2, 0.3, 0.4, 0.4, 0.3, 0.2, 0.2, 0.1, 0.1, 0.2, 0.3, 0.3, 0.2, 0.1, 0.1, 0, 0, 0, 0.2, 0.2, 0, 0, 0, 0.1, 0, -0.1, 0, 0, -0.1, 0, 0.1, 0.1, 0.2, 0.2, -0.2, -0.2, 0.2, 0.2, 0.1, 0, 0, 0, 0, 0, 0, 0, 0]
-PAWN_END_POS_BONUS = [0, 0, 0, 0, 0, 0, 0, 0, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
-KING_START_POS_BONUS = [-0.5, -0.4, -0.4, -0.4, -0.4, -0.4, -0.4, -0.5, -0.4, -0.4, -0.4, -0.4, -0.4, -0.4, -0.4, -0.4, -0.2, -0.3, -0.3, -0.3, -0.3, -0.3, -0.3, -0.2, -0.1, -0.2, -0.2, -0.2, -0.2, -0.2, -0.2, -0.1, 0, -0.1, -0.1, -0.1, -0.1, -0.1, -0.1, 0, 0, 0.2, 0, 0, 0, 0, 0.2, 0, 0.2, 0.3, 0.2, 0.2, 0.2, 0.2, 0.3, 0.2, 0.2, 0.4, 0.7, 0.4, 0.2, 0.4, 0.7, 0.2]
-KING_END_POS_BONUS = [-0.2, -0.1, -0.1, -0.1, -0.1, -0.1, -0.1, -0.2, -0.1, 0, 0.1, 0.1, 0.1, 0.1, 0, -0.1, -0.1, -0.1, 0.3, 0.4, 0.4, 0.3, -0.1, -0.1, -0.1, -0.1, 0.4, 0.5, 0.5, 0.4, -0.1, -0.1, -0.1, -0.1, 0.2, 0.4, 0.4, 0.2, -0.1, -0.1, -0.2, -0.1, 0, 0.2, 0.2, 0, -0.1, -0.2, -0.3, -0.2, -0.1, 0, 0, -0.1, -0.2, -0.3, -0.4, -0.3, -0.2, -0.2, -0.2, -0.2, -0.3, -0.4]
-ROOK_POS_BONUS = [0, 0, 0, 0, 0, 0, 0, 0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0.3, 0, 0.3, 0, 0]
+SEARCH_TIME_LIMIT = 5.0 # Seconds per move, None to search without a time limit
+SEARCH_NODE_LIMIT = None # Nodes per move, None to search without a node limit
+MAX_SEARCH_DEPTH = 32
+INFINITY_SCORE = 100000
+NULL_WINDOW = 0.001 # Width of the window that only tests whether a move beats alpha
+ASPIRATION_WINDOW = 0.5 # Root window around the score of the last iteration, widened on failure
+ASPIRATION_WINDOW_GROWTH = 4
+NULL_MOVE_REDUCTION = 2 # Extra plies taken off the search after passing the turn
+NULL_MOVE_MIN_DEPTH = 3
+LATE_MOVE_REDUCTION = 1 # Plies taken off quiet moves searched late in a node
+LATE_MOVE_MIN_DEPTH = 3
+LATE_MOVE_MIN_INDEX = 3 # Moves searched before reductions start
+DELTA_PRUNING_MARGIN = 2 # Captures that can't lift the stand pat score this close to alpha are skipped in quiescence
+PAWN_HASH_TABLE_SIZE = 16384 # Pawn structures, entries are kept for the whole game
+EVALUATION_CACHE_SIZE = 262144 # Evaluated positions, cleared every search but bounded since pondering has no limit
+MAX_SEARCH_PLY = 128 # Killer move slots, deeper than any iteration plus its extensions
+MATE_SCORE = INFINITY_SCORE - MAX_SEARCH_PLY # Being mated at a ply scores ply - MATE_SCORE, inside the widest window so the quickest mate wins and the slowest loss is still a move
+
+HASH_MOVE_SCORE = 1000000 # Move ordering scores, searched from high to low
+CAPTURE_SCORE = 100000 # Plus most valuable victim, least valuable attacker
+LOSING_CAPTURE_SCORE = -1000 # Plus the static exchange score, losing captures go after the quiet moves
+KILLER_MOVE_SCORES = (90000, 80000)
+HISTORY_SCORE_LIMIT = 70000 # Quiet moves by history score stay below the killers
+ORDERING_PIECE_VALUES = (PAWN_VALUE, ROOK_VALUE, KNIGHT_VALUE, BISHOP_VALUE, QUEEN_VALUE, 10) * 2 + (0,) # Indexed by piece code
+
+class SearchLimitReached(Exception): # Unwinds an unfinished iteration once the time or node limit is hit
+    pass
+
+search_worker_engine = None # Set in each worker process of a parallel search
+search_worker_alpha = None
+
+def init_search_worker(shared_alpha, stop_flag, engine_settings): # Runs once per worker, its engine and transposition table stay warm between moves
+    global search_worker_engine, search_worker_alpha
+    search_worker_alpha = shared_alpha
+    search_worker_engine = Engine(Chess(None), "WHITE", time_limit = None, **engine_settings)
+    search_worker_engine.stop_flag = stop_flag
+
+def search_root_move_task(board_matrix, move, depth, alpha, beta, move_counter, engine_color, search_deadline, use_shared_alpha):
+    if use_shared_alpha: # Start from the best score any worker has proven so far
+        alpha = max(alpha, search_worker_alpha.value)
+    eval = search_worker_engine.search_root_move(board_matrix, move, depth, alpha, beta, move_counter, engine_color, search_deadline)
+    if eval is not None and use_shared_alpha:
+        with search_worker_alpha.get_lock():
+            if eval > search_worker_alpha.value:
+                search_worker_alpha.value = eval
+    return eval, alpha, search_worker_engine.number_of_nodes
+
+helper_engine = None # Set in each helper process of a lazy SMP search
+
+def init_helper_search(table_name, table_size, stop_flag, engine_settings): # Helpers attach to the transposition table of the main process
+    global helper_engine
+    helper_engine = Engine(Chess(None), "WHITE", time_limit = None, **engine_settings)
+    helper_engine.transposition_table = SharedTranspositionTable(table_size, table_name)
+    helper_engine.stop_flag = stop_flag
+
+def helper_search_task(board_matrix, move_counter, engine_color, generation, first_depth): # Iterative deepening on the root position until the main process stops it
+    helper_engine.engine_color = engine_color
+    helper_engine.player_color = "BLACK" if engine_color == "WHITE" else "WHITE"
+    helper_engine.prepare_search(move_counter)
+    helper_engine.transposition_table.generation = generation
+    best_move = 0
+    best_eval = 0
+    for depth in range(first_depth, helper_engine.max_depth + 1):
+        try:
+            best_move, best_eval = helper_engine.search_aspiration_window(board_matrix, best_move or 0, best_eval, depth, move_counter)
+        except SearchLimitReached:
+            break
+    return helper_engine.number_of_nodes
 
 class Engine:
-    def __init__(self, chess, player_color):
+    def __init__(self, chess, player_color, time_limit = SEARCH_TIME_LIMIT, node_limit = SEARCH_NODE_LIMIT, max_depth = MAX_SEARCH_DEPTH, delta_pruning = True, null_move_pruning = True, null_move_reduction = NULL_MOVE_REDUCTION, late_move_reductions = True, late_move_reduction = LATE_MOVE_REDUCTION, parallel_workers = 0, threads = 1, debug_evaluation = False, exchange_evaluation = True):
         self.chess = chess
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.max_depth = max_depth
+        self.delta_pruning = delta_pruning
+        self.exchange_evaluation = exchange_evaluation # Order captures by static exchange evaluation and skip losing ones in quiescence
+        self.null_move_pruning = null_move_pruning
+        self.null_move_reduction = null_move_reduction
+        self.late_move_reductions = late_move_reductions
+        self.late_move_reduction = late_move_reduction
+        self.parallel_workers = parallel_workers # Root moves are split over this many processes, 0 searches serially
+        self.debug_evaluation = debug_evaluation # Check the incrementally updated scores of the position against a full recompute at every evaluation
+        self.threads = threads # Lazy SMP, helper processes search the same position and share the transposition table
+        self.executor = None
+        self.shared_alpha = None
+        self.search_stop_flag = None # Set by stop_search to end the search of the parallel workers
+        self.helper_executor = None
+        self.stop_flag = None # Set by the main process to end the search of the helpers
+        self.stop_requested = False # Set from another thread to end the search early
+        self.pondering = False # No time or node limit until the expected move is played
+        self.search_has_move = False
+        self.search_start = 0
+        self.search_start_nodes = 0 # Nodes searched before the limits started counting, ponder_hit moves it past the pondering nodes
+        self.search_deadline = None
+        self.search_node_limit = None
+        self.number_of_nodes = 0
         self.number_of_evaluations = 0
-        self.board_evaluations = {}
+        self.board_evaluations = LRUCache(max_entries = EVALUATION_CACHE_SIZE) # Zobrist key -> evaluation
+        self.pawn_hash_table = LRUCache(max_entries = PAWN_HASH_TABLE_SIZE) # (PAWN_WHITE, PAWN_BLACK) bitboards -> evaluate_pawn_structure
+        self.transposition_table = SharedTranspositionTable() if threads > 1 else TranspositionTable() # Kept for the whole game
+        self.root_move_counter = 0
+        self.killer_moves = [[0, 0] for _ in range(MAX_SEARCH_PLY)] # Two quiet moves per ply that caused a cutoff
+        self.history_scores = [[0] * 4096, [0] * 4096] # Butterfly table per color code, indexed by the start and end square bits of a move
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
         self.opening_moves_prep = {}
         self.load_openings()
         self.player_color = player_color
         self.engine_color = "WHITE" if player_color == "BLACK" else "BLACK"
     
-    def calculate_move(self, initial_board_matrix, move_counter):
+    def calculate_move(self, initial_board_matrix, move_counter, ponder = False): # Pondering searches the position after the expected reply until ponder_hit or stop_search
         timestamp = time.time()
+        self.search_start = timestamp
+        self.search_start_nodes = 0
+        self.pondering = ponder
+        self.search_has_move = False
         
         if move_counter <= OPENING_THRESHOLD:
-            key = ""
-            for piece_type, piece_position in initial_board_matrix.items():
-                if piece_type in ("en_passant_position", "last_capture_or_pawn_move"):
-                    continue
-                else:
-                    key += str(piece_position)
+            key = str(initial_board_matrix.zobrist_key) # JSON object keys are strings
             
             if key in self.opening_moves_prep[self.engine_color]:
                 from_position, to_position = random.choice(self.opening_moves_prep[self.engine_color][key])
                 print("Move found in opening preparation")
                 print(f"Search time: {(time.time() - timestamp):.2f}s")
-                return from_position, to_position
+                return self.chess.create_move(initial_board_matrix, from_position, to_position)
             else:
                 print("No suitable move found in opening prep.")
         
-        best_eval = -1000000
-        best_from_position = None
-        best_to_position = None
-        self.number_of_evaluations = 0
-        self.board_evaluations = {}
-        depth = 2
-        
-        if move_counter > ENDGAME_THRESHOLD:
-            depth += int(move_counter/ENDGAME_THRESHOLD)
-        
-        for position_exponent in range(64):
-            from_position = (1 << position_exponent)
-            if self.chess.is_own_piece(from_position, self.engine_color, initial_board_matrix):
-                for to_position in self.chess.calculate_possible_moves(initial_board_matrix, from_position):
-                    temp_board = initial_board_matrix.copy()
-                    self.chess.move_piece(from_position, to_position, temp_board)
-                    new_eval = self.minimax(temp_board, depth, best_eval, 100000, False, move_counter + 1, self.engine_color, self.player_color)
-                    if new_eval > best_eval:
-                        best_from_position = from_position
-                        best_to_position = to_position
-                        best_eval = new_eval
+        best_move = None
+        self.prepare_search(move_counter)
+        self.search_deadline = None # The first iteration always completes so there is a move to return
+        self.search_node_limit = None
+        
+        board_matrix = initial_board_matrix.copy() # The search makes and unmakes its moves on this copy
+        best_eval = 0
+        helper_futures = self.start_helpers(board_matrix, move_counter) if self.threads > 1 else []
+        for depth in range(1, self.max_depth + 1):
+            try:
+                if self.parallel_workers:
+                    iteration_best_move, iteration_best_eval = self.search_root_parallel(board_matrix, best_move or 0, depth, move_counter)
+                else:
+                    iteration_best_move, iteration_best_eval = self.search_aspiration_window(board_matrix, best_move or 0, best_eval, depth, move_counter)
+            except SearchLimitReached: # The unfinished iteration is discarded
+                break
+            if iteration_best_move is not None: # The last move found stays if this iteration had none
+                best_move = iteration_best_move
+            best_eval = iteration_best_eval
+            self.search_has_move = True
+            print(f"depth {depth} completed, best move {best_move}, eval {best_eval:.2f}, {self.number_of_nodes} nodes, {(time.time() - timestamp):.2f}s, first move cutoffs {self.first_move_cutoffs}/{self.cutoffs}")
+            
+            if self.stop_requested:
+                break
+            if self.pondering:
+                continue
+            if self.time_limit is not None:
+                self.search_deadline = self.search_start + self.time_limit
+                if time.time() >= self.search_deadline:
+                    break
+            if self.node_limit is not None:
+                self.search_node_limit = self.search_start_nodes + self.node_limit
+                if self.number_of_nodes >= self.search_node_limit:
+                    break
         
+        if helper_futures:
+            self.stop_flag.value = 1
+            helper_nodes = sum(future.result() for future in helper_futures)
+            print(f"helper nodes: {helper_nodes}, shared table hits {self.transposition_table.hits}/{self.transposition_table.probes}")
         print("number of evaluate calls: " + str(self.number_of_evaluations))
+        print(f"pawn hash hit rate: {self.pawn_hash_table.get_stats()['hit_rate']:.2%}")
         print(f"calculation time: {(time.time() - timestamp):.2f}s")
-        return best_from_position, best_to_position
+        return best_move
+    
+    def ponder_hit(self): # The expected move was played, the search goes on with the normal limits counted from now
+        self.search_start = time.time()
+        self.search_start_nodes = self.number_of_nodes
+        self.pondering = False
+        if self.search_has_move: # Otherwise the limits are set once the first iteration completes
+            if self.time_limit is not None:
+                self.search_deadline = self.search_start + self.time_limit
+            if self.node_limit is not None:
+                self.search_node_limit = self.search_start_nodes + self.node_limit
+    
+    def stop_search(self): # Called from another thread, calculate_move returns the best move found so far
+        self.stop_requested = True
+        if self.search_stop_flag is not None:
+            self.search_stop_flag.value = 1
+    
+    def clear_stop(self): # Called before the thread of the next search starts, so a stop_search arriving early isn't lost
+        self.stop_requested = False
+        if self.search_stop_flag is not None:
+            self.search_stop_flag.value = 0
+    
+    def get_ponder_move(self, board_matrix, color): # Expected reply from the transposition table, None if it has no legal move stored
+        entry = self.transposition_table.probe(board_matrix.zobrist_key)
+        if entry and entry[3] in self.chess.generate_moves(board_matrix, color):
+            return entry[3]
+        return None
+    
+    def prepare_search(self, move_counter):
+        self.number_of_nodes = 0
+        self.number_of_evaluations = 0
+        self.board_evaluations.clear()
+        self.transposition_table.new_search()
+        self.root_move_counter = move_counter
+        self.killer_moves = [[0, 0] for _ in range(MAX_SEARCH_PLY)]
+        for history_scores in self.history_scores: # Older history still helps, but counts for less
+            for index in range(4096):
+                history_scores[index] >>= 1
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+    
+    def start_helpers(self, board_matrix, move_counter): # Odd helpers start one ply deeper, so they fill the table ahead of the main search
+        if self.helper_executor is None:
+            self.stop_flag = multiprocessing.Value("b", 0)
+            engine_settings = {"max_depth": self.max_depth, "delta_pruning": self.delta_pruning, "exchange_evaluation": self.exchange_evaluation, "null_move_pruning": self.null_move_pruning, "null_move_reduction": self.null_move_reduction, "late_move_reductions": self.late_move_reductions, "late_move_reduction": self.late_move_reduction}
+            self.helper_executor = ProcessPoolExecutor(self.threads - 1, initializer = init_helper_search, initargs = (self.transposition_table.name, self.transposition_table.size, self.stop_flag, engine_settings))
+        self.stop_flag.value = 0
+        return [self.helper_executor.submit(helper_search_task, board_matrix, move_counter, self.engine_color, self.transposition_table.generation, 1 + helper_index % 2) for helper_index in range(1, self.threads)]
+    
+    def search_root_parallel(self, board_matrix, previous_best_move, depth, move_counter): # Same move as search_root, ties go to the move ordered first
+        if self.executor is None:
+            self.shared_alpha = multiprocessing.Value("d", -INFINITY_SCORE)
+            self.search_stop_flag = multiprocessing.Value("b", 0)
+            engine_settings = {"max_depth": self.max_depth, "delta_pruning": self.delta_pruning, "exchange_evaluation": self.exchange_evaluation, "null_move_pruning": self.null_move_pruning, "null_move_reduction": self.null_move_reduction, "late_move_reductions": self.late_move_reductions, "late_move_reduction": self.late_move_reduction}
+            self.executor = ProcessPoolExecutor(self.parallel_workers, initializer = init_search_worker, initargs = (self.shared_alpha, self.search_stop_flag, engine_settings))
+        if self.stop_requested: # The stop may have come before the flag existed
+            raise SearchLimitReached()
+        
+        moves, scores = self.score_moves(board_matrix, self.chess.generate_moves(board_matrix, self.engine_color), previous_best_move, 0, COLOR_CODES[self.engine_color])
+        moves = [self.pick_move(moves, scores, index) for index in range(len(moves))]
+        if not moves:
+            return None, -INFINITY_SCORE
+        
+        self.shared_alpha.value = -INFINITY_SCORE
+        results = [None] * len(moves) # Score and the alpha it was searched with per move
+        first_result = self.executor.submit(search_root_move_task, board_matrix, moves[0], depth, -INFINITY_SCORE, INFINITY_SCORE, move_counter, self.engine_color, self.search_deadline, True).result() # The expected best move sets alpha for the rest
+        futures = {self.executor.submit(search_root_move_task, board_matrix, move, depth, -INFINITY_SCORE, INFINITY_SCORE, move_counter, self.engine_color, self.search_deadline, True): index for index, move in enumerate(moves) if index > 0}
+        results[0] = first_result
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+        if any(eval is None for eval, _, _ in results):
+            raise SearchLimitReached()
+        self.number_of_nodes += sum(nodes for _, _, nodes in results)
+        
+        best_eval = max(eval for eval, _, _ in results)
+        best_index = next(index for index, (eval, alpha, _) in enumerate(results) if eval == best_eval and eval > alpha)
+        tied_indices = [index for index, (eval, alpha, _) in enumerate(results[:best_index]) if alpha >= best_eval] # Failed low against the best score, so they may equal it
+        futures = {self.executor.submit(search_root_move_task, board_matrix, moves[index], depth, best_eval - NULL_WINDOW, best_eval + NULL_WINDOW, move_counter, self.engine_color, self.search_deadline, False): index for index in tied_indices}
+        for future in as_completed(futures):
+            eval, _, nodes = future.result()
+            if eval is None:
+                raise SearchLimitReached()
+            self.number_of_nodes += nodes
+            if eval >= best_eval and futures[future] < best_index:
+                best_index = futures[future]
+        
+        return moves[best_index], best_eval
+    
+    def search_root_move(self, board_matrix, move, depth, alpha, beta, move_counter, engine_color, search_deadline): # Score of one root move, None if the deadline is hit
+        if move_counter != self.root_move_counter:
+            self.prepare_search(move_counter)
+        self.number_of_nodes = 0
+        self.engine_color = engine_color
+        self.player_color = "BLACK" if engine_color == "WHITE" else "WHITE"
+        self.search_deadline = search_deadline
+        undo = self.chess.make_move(board_matrix, move)
+        try:
+            eval = -self.negamax(board_matrix, depth - 1, -beta, -alpha, move_counter + 1, self.player_color)
+        except SearchLimitReached:
+            return None
+        self.chess.unmake_move(board_matrix, undo)
+        return eval
+    
+    def close(self): # Stops the worker processes of the parallel search and frees the shared transposition table
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        if self.helper_executor is not None:
+            self.helper_executor.shutdown()
+            self.helper_executor = None
+        if self.threads > 1 and self.transposition_table is not None:
+            self.transposition_table.close()
+            self.transposition_table = None
+    
+    def search_aspiration_window(self, board_matrix, previous_best_move, previous_eval, depth, move_counter):
+        if depth == 1: # No previous score to center a window on
+            return self.search_root(board_matrix, previous_best_move, depth, -INFINITY_SCORE, INFINITY_SCORE, move_counter)
+        
+        window = ASPIRATION_WINDOW
+        while True:
+            alpha = max(previous_eval - window, -INFINITY_SCORE)
+            beta = min(previous_eval + window, INFINITY_SCORE)
+            best_move, best_eval = self.search_root(board_matrix, previous_best_move, depth, alpha, beta, move_counter)
+            if (best_eval > alpha or alpha == -INFINITY_SCORE) and (best_eval < beta or beta == INFINITY_SCORE):
+                return best_move, best_eval
+            previous_best_move = best_move or previous_best_move
+            window *= ASPIRATION_WINDOW_GROWTH
+    
+    def search_root(self, board_matrix, previous_best_move, depth, alpha, beta, move_counter): # The best move of the last iteration is searched first
+        best_eval = -INFINITY_SCORE
+        best_move = None
+        moves, scores = self.score_moves(board_matrix, self.chess.generate_moves(board_matrix, self.engine_color), previous_best_move, 0, COLOR_CODES[self.engine_color])
+        for index in range(len(moves)):
+            move = self.pick_move(moves, scores, index)
+            undo = self.chess.make_move(board_matrix, move)
+            eval = self.search_child(board_matrix, depth, alpha, beta, move_counter, self.player_color, index)
+            self.chess.unmake_move(board_matrix, undo)
+            if eval > best_eval:
+                best_move = move
+                best_eval = eval
+                alpha = max(alpha, eval)
+                if alpha >= beta:
+                    break
+        return best_move, best_eval
+    
+    def search_child(self, board_matrix, depth, alpha, beta, move_counter, child_color, move_index, reduction = 0): # Principal variation search of a move that has just been made
+        if move_index == 0:
+            return -self.negamax(board_matrix, depth - 1, -beta, -alpha, move_counter + 1, child_color)
+        if reduction:
+            eval = -self.negamax(board_matrix, depth - 1 - reduction, -alpha - NULL_WINDOW, -alpha, move_counter + 1, child_color)
+            if eval <= alpha: # The reduced search agrees the move is no better
+                return eval
+        eval = -self.negamax(board_matrix, depth - 1, -alpha - NULL_WINDOW, -alpha, move_counter + 1, child_color) # Later moves only have to prove they are no better
+        if alpha < eval < beta: # It was better after all, search again for the exact score
+            eval = -self.negamax(board_matrix, depth - 1, -beta, -alpha, move_counter + 1, child_color)
+        return eval
+    
+    def score_moves(self, board_matrix, moves, hash_move, ply, color_code): # Copy of the moves with their ordering scores
+        mailbox = board_matrix.mailbox
+        killer_moves = self.killer_moves[ply]
+        history_scores = self.history_scores[color_code]
+        scores = []
+        for move in moves:
+            if move == hash_move:
+                score = HASH_MOVE_SCORE
+            elif (move >> 12) & (MOVE_CAPTURE | MOVE_PROMOTION):
+                victim = PAWN_WHITE if (move >> 12) & MOVE_EN_PASSANT else mailbox[(move >> 6) & 63]
+                score = CAPTURE_SCORE + ORDERING_PIECE_VALUES[victim] * 100 - ORDERING_PIECE_VALUES[mailbox[move & 63]]
+                if (move >> 12) & MOVE_PROMOTION:
+                    score += ORDERING_PIECE_VALUES[move >> 17] * 100
+                elif self.exchange_evaluation and ORDERING_PIECE_VALUES[victim] < ORDERING_PIECE_VALUES[mailbox[move & 63]]: # Only a capture of a cheaper piece can lose material
+                    exchange_score = self.chess.see(board_matrix, move)
+                    if exchange_score < 0:
+                        score = LOSING_CAPTURE_SCORE + exchange_score
+            elif move == killer_moves[0]:
+                score = KILLER_MOVE_SCORES[0]
+            elif move == killer_moves[1]:
+                score = KILLER_MOVE_SCORES[1]
+            elif ply > 0: # Root quiet moves keep their generation order, so serial and parallel searches break ties alike
+                score = min(history_scores[move & 4095], HISTORY_SCORE_LIMIT)
+            else:
+                score = 0
+            scores.append(score)
+        return list(moves), scores
+    
+    def pick_move(self, moves, scores, index): # Selection step, swaps the best remaining move to the index so later moves are only ordered if reached
+        best_index = index
+        for other_index in range(index + 1, len(moves)):
+            if scores[other_index] > scores[best_index]:
+                best_index = other_index
+        moves[index], moves[best_index] = moves[best_index], moves[index]
+        scores[index], scores[best_index] = scores[best_index], scores[index]
+        return moves[index]
+    
+    def record_cutoff(self, move, depth, ply, color_code, move_index):
+        self.cutoffs += 1
+        if move_index == 0:
+            self.first_move_cutoffs += 1
+        if (move >> 12) & (MOVE_CAPTURE | MOVE_PROMOTION): # Captures are already ordered first
+            return
+        killer_moves = self.killer_moves[ply]
+        if move != killer_moves[0]:
+            killer_moves[1] = killer_moves[0]
+            killer_moves[0] = move
+        self.history_scores[color_code][move & 4095] += depth * depth
+    
+    def check_search_limits(self):
+        if self.search_deadline is not None and time.time() >= self.search_deadline:
+            raise SearchLimitReached()
+        if self.search_node_limit is not None and self.number_of_nodes >= self.search_node_limit:
+            raise SearchLimitReached()
+        if self.stop_requested or (self.stop_flag is not None and self.stop_flag.value):
+            raise SearchLimitReached()
     
     def evaluate(self, board_matrix, maximazing_player, move_counter, engine_color):
-        board_matrix_hashed = hash(str(board_matrix))
-        if board_matrix_hashed in self.board_evaluations:
-            return self.board_evaluations[board_matrix_hashed]
+        board_matrix_hashed = board_matrix.hash_key()
+        eval = self.board_evaluations.get(board_matrix_hashed)
+        if eval is not None:
+            return eval
         
         eval = 0
         self.number_of_evaluations += 1
+        ply = move_counter - self.root_move_counter
         
         if self.chess.is_in_check(engine_color == "WHITE", board_matrix):
             if self.chess.is_in_checkmate(engine_color == "WHITE", board_matrix):
-                return -10000
+                return ply - MATE_SCORE
             else:
                 eval -= IN_CHECK_BONUS
         elif self.chess.is_in_check(engine_color == "BLACK", board_matrix):
             if self.chess.is_in_checkmate(engine_color == "BLACK", board_matrix):
-                return 10000
+                return MATE_SCORE - ply
             else:
                 eval += IN_CHECK_BONUS
         
-        for position_exponent in range(64):
-            position = (1 << position_exponent)
-            piece_type, piece_color = self.chess.identify_piece(position, board_matrix)
-            
-            if piece_type:
-                temp_eval = 0
-                if piece_type == "PAWN":
-                    temp_eval += PAWN_VALUE
-                    if move_counter > ENDGAME_THRESHOLD:
-                        temp_eval += PAWN_END_POS_BONUS[position_exponent if piece_color == "BLACK" else (63 - position_exponent)]
-                    else:
-                        temp_eval += PAWN_START_POS_BONUS[position_exponent if piece_color == "BLACK" else (63 - position_exponent)]
-                elif piece_type == "ROOK":
-                    temp_eval += ROOK_VALUE + ROOK_POS_BONUS[position_exponent if piece_color == "BLACK" else (63 - position_exponent)]
-                elif piece_type == "KNIGHT":
-                    temp_eval += KNIGHT_VALUE + KNIGHT_POS_BONUS[position_exponent]
-                elif piece_type == "BISHOP":
-                    temp_eval += BISHOP_VALUE + BISHOP_POS_BONUS[position_exponent]
-                elif piece_type == "QUEEN":
-                    temp_eval += QUEEN_VALUE + BISHOP_POS_BONUS[position_exponent]
-                elif piece_type == "KING":
-                    if move_counter > ENDGAME_THRESHOLD:
-                        temp_eval += KING_END_POS_BONUS[position_exponent if piece_color == "BLACK" else (63 - position_exponent)]
-                    else:
-                        temp_eval += KING_START_POS_BONUS[position_exponent if piece_color == "BLACK" else (63 - position_exponent)]
-                eval += temp_eval if piece_color == engine_color else -temp_eval
-
-        self.board_evaluations[board_matrix_hashed] = eval
+        eval = (round(eval * CENTIPAWNS) + self.static_evaluation(board_matrix, engine_color)) / CENTIPAWNS # Whole centipawns, so equal positions compare equal whatever the search order
+        
+        self.board_evaluations.put(board_matrix_hashed, eval)
         return eval
     
-    def minimax(self, board_matrix, depth, alpha, beta, maximazing_player, move_counter, engine_color, player_color):
-        if depth == 0:
-            return self.evaluate(board_matrix, maximazing_player, move_counter, engine_color)
-        
-        if maximazing_player:
-            maxEval = -100000
-            for position_exponent in range(64):
-                from_position = (1 << position_exponent)
-                if self.chess.is_own_piece(from_position, engine_color, board_matrix):
-                    for to_position in self.chess.calculate_possible_moves(board_matrix, from_position):
-                        temp_board = board_matrix.copy()
-                        if self.chess.move_piece(from_position, to_position, temp_board) and depth == 1:
-                            depth += 1
-                        eval = self.minimax(temp_board, depth - 1, alpha, beta, False, move_counter + 1, engine_color, player_color)
-                        maxEval = max(maxEval, eval)
-                        alpha = max(alpha, maxEval)
-                        if beta <= alpha:
-                            break
-            return maxEval
+    def static_evaluation(self, board_matrix, engine_color): # Material, piece-square and pawn terms in centipawns without the check terms, batch_evaluation.evaluate_batch computes the same for many positions
+        if self.debug_evaluation and (board_matrix.midgame_score, board_matrix.endgame_score, board_matrix.phase) != board_matrix.calculate_piece_square_scores() + (board_matrix.calculate_phase(),):
+            raise ValueError(f"Incremental scores and phase {(board_matrix.midgame_score, board_matrix.endgame_score, board_matrix.phase)} differ from the recomputed {board_matrix.calculate_piece_square_scores() + (board_matrix.calculate_phase(),)}")
+        pawn_midgame_score, pawn_endgame_score, _, _ = self.probe_pawn_structure(board_matrix)
+        score = tapered_score(board_matrix.midgame_score + pawn_midgame_score, board_matrix.endgame_score + pawn_endgame_score, board_matrix.phase) # The position keeps its scores up to date by every move, from white's point of view
+        return score if engine_color == "WHITE" else -score
+    
+    def probe_pawn_structure(self, board_matrix): # Pawn terms only change with pawn moves and captures, so most nodes find them cached
+        key = (board_matrix.bitboards[PAWN_WHITE], board_matrix.bitboards[PAWN_BLACK])
+        entry = self.pawn_hash_table.get(key)
+        if entry is None:
+            entry = evaluate_pawn_structure(*key)
+            self.pawn_hash_table.put(key, entry)
+        return entry
+    
+    def negamax(self, board_matrix, depth, alpha, beta, move_counter, color, allow_null_move = True): # Scores are from the point of view of the color to move
+        self.number_of_nodes += 1
+        self.check_search_limits()
+        if depth <= 0:
+            return self.quiescence(board_matrix, alpha, beta, move_counter, color)
+        
+        alpha_original = alpha
+        hash_move = 0
+        entry = self.transposition_table.probe(board_matrix.zobrist_key)
+        if entry:
+            entry_depth, entry_score, entry_bound, hash_move = entry
+            if entry_depth >= depth and (entry_bound == EXACT or (entry_bound == LOWER_BOUND and entry_score >= beta) or (entry_bound == UPPER_BOUND and entry_score <= alpha)):
+                return entry_score
+        
+        opponent_color = "BLACK" if color == "WHITE" else "WHITE"
+        ply = move_counter - self.root_move_counter
+        color_code = COLOR_CODES[color]
+        in_check = self.chess.is_in_check(color == "WHITE", board_matrix)
+        
+        if self.null_move_pruning and allow_null_move and depth >= NULL_MOVE_MIN_DEPTH and beta - alpha < 2 * NULL_WINDOW and not in_check and self.has_pieces(board_matrix, color_code): # Null windows come out a rounding error wider or narrower than NULL_WINDOW; without pieces passing could be the only good move (zugzwang)
+            undo = self.chess.make_null_move(board_matrix)
+            eval = -self.negamax(board_matrix, depth - 1 - self.null_move_reduction, -beta, -beta + NULL_WINDOW, move_counter + 1, opponent_color, False)
+            self.chess.unmake_null_move(board_matrix, undo)
+            if eval >= beta:
+                return eval
+        
+        moves, scores = self.score_moves(board_matrix, self.chess.generate_moves(board_matrix, color), hash_move, ply, color_code) # The hash move follows the principal variation of the previous iteration
+        
+        if not moves: # Checkmated, or stalemate which is a draw
+            return ply - MATE_SCORE if in_check else 0
+        
+        best_eval = -INFINITY_SCORE
+        best_move = 0
+        for index in range(len(moves)):
+            move = self.pick_move(moves, scores, index)
+            undo = self.chess.make_move(board_matrix, move)
+            reduction = 0
+            if self.late_move_reductions and index >= LATE_MOVE_MIN_INDEX and depth >= LATE_MOVE_MIN_DEPTH and not in_check and scores[index] < KILLER_MOVE_SCORES[1] and not self.chess.is_in_check(opponent_color == "WHITE", board_matrix): # Quiet non-killer moves and losing captures that don't give check
+                reduction = self.late_move_reduction
+            eval = self.search_child(board_matrix, depth, alpha, beta, move_counter, opponent_color, index, reduction)
+            self.chess.unmake_move(board_matrix, undo)
+            if eval > best_eval:
+                best_eval = eval
+                best_move = move
+                if eval > alpha:
+                    alpha = eval
+                    if alpha >= beta:
+                        self.record_cutoff(move, depth, ply, color_code, index)
+                        break
+        
+        self.store_transposition(board_matrix, depth, best_eval, alpha_original, beta, best_move)
+        return best_eval
+    
+    def has_pieces(self, board_matrix, color_code): # Anything besides pawns and the king
+        return board_matrix.color_pieces[color_code] & ~(board_matrix.bitboards[PAWN_BLACK + 6 * color_code] | board_matrix.bitboards[KING_BLACK + 6 * color_code]) != 0
+    
+    def quiescence(self, board_matrix, alpha, beta, move_counter, color): # Only captures are searched until the position is quiet
+        self.number_of_nodes += 1
+        self.check_search_limits()
+        stand_pat = self.evaluate(board_matrix, color == self.engine_color, move_counter, self.engine_color)
+        if color != self.engine_color:
+            stand_pat = -stand_pat
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+        
+        opponent_color = "BLACK" if color == "WHITE" else "WHITE"
+        captures = [move for move in self.chess.generate_moves(board_matrix, color) if (move >> 12) & MOVE_CAPTURE]
+        captures, scores = self.score_moves(board_matrix, captures, 0, move_counter - self.root_move_counter, COLOR_CODES[color])
+        best_eval = stand_pat
+        for index in range(len(captures)):
+            move = self.pick_move(captures, scores, index)
+            if scores[index] < 0: # Only losing captures are left
+                break
+            if self.delta_pruning:
+                gain = ORDERING_PIECE_VALUES[PAWN_WHITE if (move >> 12) & MOVE_EN_PASSANT else board_matrix.mailbox[(move >> 6) & 63]] + DELTA_PRUNING_MARGIN
+                if (move >> 12) & MOVE_PROMOTION:
+                    gain += ORDERING_PIECE_VALUES[move >> 17]
+                if stand_pat + gain <= alpha:
+                    continue
+            undo = self.chess.make_move(board_matrix, move)
+            eval = -self.quiescence(board_matrix, -beta, -alpha, move_counter + 1, opponent_color)
+            self.chess.unmake_move(board_matrix, undo)
+            if eval > best_eval:
+                best_eval = eval
+                if eval > alpha:
+                    alpha = eval
+                    if alpha >= beta:
+                        break
+        return best_eval
+    
+    def store_transposition(self, board_matrix, depth, score, alpha, beta, best_move): # Bound type from the window the node was searched with
+        if score <= alpha:
+            bound = UPPER_BOUND
+        elif score >= beta:
+            bound = LOWER_BOUND
         else:
-            minEval = 100000
-            for position_exponent in range(64):
-                from_position = (1 << position_exponent)
-                if self.chess.is_own_piece(from_position, player_color, board_matrix):
-                    for to_position in self.chess.calculate_possible_moves(board_matrix, from_position):
-                        temp_board = board_matrix.copy()
-                        self.chess.move_piece(from_position, to_position, temp_board)
-                        eval = self.minimax(temp_board, depth - 1, alpha, beta, True, move_counter + 1, engine_color, player_color)
-                        minEval = min(minEval, eval)
-                        beta = min(beta, minEval)
-                        if beta <= alpha:
-                            break
-            return minEval
+            bound = EXACT
+        self.transposition_table.store(board_matrix.zobrist_key, depth, score, bound, best_move)
              
     def load_openings(self):
         
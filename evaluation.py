@@ -0,0 +1,90 @@
+PAWN_VALUE = 1
+BISHOP_VALUE = 3
+KNIGHT_VALUE = 3
+ROOK_VALUE = 5
+QUEEN_VALUE = 7
+
+KNIGHT_POS_BONUS = [-0.5,-0.4, -0.2, -0.1, -0.1, -0.2, -0.4, -0.5, -0.4, -0.2, -0.1, 0.1, 0.1, -0.1, -0.2, -0.4, -0.2, -0.1, 0.1, 0.3, 0.3, 0.1, -0.1, -0.2, -0.1, 0.1, 0.3, 0.5, 0.5, 0.3, 0.1, -0.1, -0.1, 0.1, 0.3, 0.5, 0.5, 0.3, 0.1, -0.1, -0.2, -0.1, 0.1, 0.3, 0.3, 0.1, -0.1, -0.2, -0.4, -0.2, -0.1, 0.1, 0.1, -0.1, -0.2, -0.4, -0.5, -0.4, -0.2, -0.1, -0.1, -0.2, -0.4, -0.5]
+BISHOP_POS_BONUS = [-0.2, -0.1, 0, 0.1, 0.1, 0, -0.1, -0.2, -0.1, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, -0.1, 0, 0.2, 0.4, 0.4, 0.4, 0.4, 0.2, 0, 0.1, 0.3, 0.4, 0.5, 0.5, 0.4, 0.3, 0.1, 0.1, 0.3, 0.4, 0.5, 0.5, 0.4, 0.3, 0.1, 0, 0.2, 0.4, 0.4, 0.4, 0.4, 0.2, 0, -0.1, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, -0.1, -0.2, -0.1, 0, 0.1, 0.1, 0, -0.1, -0.2]
+QUEEN_POS_BONUS = [-0.4, -0.2, 0, 0.2, 0.2, 0, -0.2, -0.4, -0.2, 0, 0.2, 0.4, 0.4, 0.2, 0, -0.2, 0, 0.2, 0.4, 0.5, 0.5, 0.4, 0.2, 0, 0.2, 0.4, 0.5, 0.6, 0.6, 0.5, 0.4, 0.2, 0.2, 0.4, 0.5, 0.6, 0.6, 0.5, 0.4, 0.2, 0, 0.2, 0.4, 0.5, 0.5, 0.4, 0.2, 0, -0.2, 0, 0.2, 0.4, 0.4, 0.2, 0, -0.2, -0.4, -0.2, 0, 0.2, 0.2, 0, -0.2, -0.4]
+PAWN_START_POS_BONUS = [0, 0, 0, 0, 0, 0, 0, 0, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.2, 0.2, 0.3, 0.4, 0.4, 0.3, 0.2, 0.2, 0.1, 0.1, 0.2, 0.3, 0.3, 0.2, 0.1, 0.1, 0, 0, 0, 0.2, 0.2, 0, 0, 0, 0.1, 0, -0.1, 0, 0, -0.1, 0, 0.1, 0.1, 0.2, 0.2, -0.2, -0.2, 0.2, 0.2, 0.1, 0, 0, 0, 0, 0, 0, 0, 0]
+PAWN_END_POS_BONUS = [0, 0, 0, 0, 0, 0, 0, 0, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
+KING_START_POS_BONUS = [-0.5, -0.4, -0.4, -0.4, -0.4, -0.4, -0.4, -0.5, -0.4, -0.4, -0.4, -0.4, -0.4, -0.4, -0.4, -0.4, -0.2, -0.3, -0.3, -0.3, -0.3, -0.3, -0.3, -0.2, -0.1, -0.2, -0.2, -0.2, -0.2, -0.2, -0.2, -0.1, 0, -0.1, -0.1, -0.1, -0.1, -0.1, -0.1, 0, 0, 0.2, 0, 0, 0, 0, 0.2, 0, 0.2, 0.3, 0.2, 0.2, 0.2, 0.2, 0.3, 0.2, 0.2, 0.4, 0.7, 0.4, 0.2, 0.4, 0.7, 0.2]
+KING_END_POS_BONUS = [-0.2, -0.1, -0.1, -0.1, -0.1, -0.1, -0.1, -0.2, -0.1, 0, 0.1, 0.1, 0.1, 0.1, 0, -0.1, -0.1, -0.1, 0.3, 0.4, 0.4, 0.3, -0.1, -0.1, -0.1, -0.1, 0.4, 0.5, 0.5, 0.4, -0.1, -0.1, -0.1, -0.1, 0.2, 0.4, 0.4, 0.2, -0.1, -0.1, -0.2, -0.1, 0, 0.2, 0.2, 0, -0.1, -0.2, -0.3, -0.2, -0.1, 0, 0, -0.1, -0.2, -0.3, -0.4, -0.3, -0.2, -0.2, -0.2, -0.2, -0.3, -0.4]
+ROOK_POS_BONUS = [0, 0, 0, 0, 0, 0, 0, 0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0.3, 0, 0.3, 0, 0]
+
+EXCHANGE_PIECE_VALUES = (PAWN_VALUE, ROOK_VALUE, KNIGHT_VALUE, BISHOP_VALUE, QUEEN_VALUE, 100) * 2 + (0,) # Per piece code, the king is worth more than anything it could win
+
+CENTIPAWNS = 100 # Piece-square scores are kept as integers, so sums updated move by move can't drift
+PIECE_TYPE_ORDER = ("PAWN", "ROOK", "KNIGHT", "BISHOP", "QUEEN", "KING") # Order of the piece codes of mychess, per color
+
+def build_piece_square_scores(endgame): # Material plus positional bonus per piece code and square index in centipawns, positive for white
+    piece_values = {"PAWN": PAWN_VALUE, "ROOK": ROOK_VALUE, "KNIGHT": KNIGHT_VALUE, "BISHOP": BISHOP_VALUE, "QUEEN": QUEEN_VALUE, "KING": 0}
+    position_bonuses = {"PAWN": PAWN_END_POS_BONUS if endgame else PAWN_START_POS_BONUS, "ROOK": ROOK_POS_BONUS, "KNIGHT": KNIGHT_POS_BONUS, "BISHOP": BISHOP_POS_BONUS, "QUEEN": BISHOP_POS_BONUS, "KING": KING_END_POS_BONUS if endgame else KING_START_POS_BONUS}
+    mirrored_piece_types = ("PAWN", "ROOK", "KING") # White reads these tables from the other side of the board
+    scores = []
+    for piece_color in ("BLACK", "WHITE"):
+        for piece_type in PIECE_TYPE_ORDER:
+            sign = 1 if piece_color == "WHITE" else -1
+            mirrored = piece_color == "WHITE" and piece_type in mirrored_piece_types
+            scores.append([sign * round((piece_values[piece_type] + position_bonuses[piece_type][63 - square_index if mirrored else square_index]) * CENTIPAWNS) for square_index in range(64)])
+    return scores
+
+MIDGAME_PIECE_SQUARE_SCORES = build_piece_square_scores(False)
+ENDGAME_PIECE_SQUARE_SCORES = build_piece_square_scores(True)
+
+PHASE_WEIGHTS = (0, 2, 1, 1, 4, 0) * 2 # Per piece code, how much the piece keeps the game in the midgame
+MAX_PHASE = 24 # Phase of the starting material, 0 is a pure endgame
+
+def tapered_score(midgame_score, endgame_score, phase): # Blend of the two scores by the game phase, in whole centipawns
+    phase = min(phase, MAX_PHASE) # Promotions can add more material than the game started with
+    return (midgame_score * phase + endgame_score * (MAX_PHASE - phase)) // MAX_PHASE
+
+PASSED_PAWN_MIDGAME_BONUSES = (0, 5, 10, 15, 25, 40, 60, 0) # Centipawns by ranks advanced from the own back rank
+PASSED_PAWN_ENDGAME_BONUSES = (0, 10, 20, 35, 55, 80, 120, 0)
+ISOLATED_PAWN_PENALTY = 15 # No own pawn on an adjacent file
+DOUBLED_PAWN_PENALTY = 15 # Per extra pawn on a file
+BACKWARD_PAWN_PENALTY = 10 # No own pawn beside or behind on an adjacent file, and the square in front is guarded by an opponent pawn
+
+FILE_MASKS = [sum(1 << (row * 8 + col) for row in range(8)) for col in range(8)]
+ROW_MASKS = [0xFF << (row * 8) for row in range(8)] # Row 0 is rank 8
+ADJACENT_FILE_MASKS = [(FILE_MASKS[col - 1] if col > 0 else 0) | (FILE_MASKS[col + 1] if col < 7 else 0) for col in range(8)]
+ROWS_ABOVE_MASKS = [sum(ROW_MASKS[:row]) for row in range(8)] # Rows nearer rank 8, where white pawns move
+ROWS_BELOW_MASKS = [sum(ROW_MASKS[row + 1:]) for row in range(8)]
+WHITE_PASSED_PAWN_MASKS = [(FILE_MASKS[square_index % 8] | ADJACENT_FILE_MASKS[square_index % 8]) & ROWS_ABOVE_MASKS[square_index // 8] for square_index in range(64)] # Squares that must be free of opponent pawns
+BLACK_PASSED_PAWN_MASKS = [(FILE_MASKS[square_index % 8] | ADJACENT_FILE_MASKS[square_index % 8]) & ROWS_BELOW_MASKS[square_index // 8] for square_index in range(64)]
+
+def evaluate_pawns(pawns, opponent_pawns, white): # Midgame score, endgame score and passed pawns of one side
+    midgame_score = endgame_score = passed_pawns = 0
+    passed_pawn_masks = WHITE_PASSED_PAWN_MASKS if white else BLACK_PASSED_PAWN_MASKS
+    for col in range(8):
+        pawns_on_file = bin(pawns & FILE_MASKS[col]).count("1")
+        if pawns_on_file > 1:
+            midgame_score -= DOUBLED_PAWN_PENALTY * (pawns_on_file - 1)
+            endgame_score -= DOUBLED_PAWN_PENALTY * (pawns_on_file - 1)
+    remaining_pawns = pawns
+    while remaining_pawns:
+        position = remaining_pawns & -remaining_pawns
+        remaining_pawns ^= position
+        square_index = position.bit_length() - 1
+        row, col = divmod(square_index, 8)
+        if not opponent_pawns & passed_pawn_masks[square_index]:
+            passed_pawns |= position
+            ranks_advanced = 7 - row if white else row
+            midgame_score += PASSED_PAWN_MIDGAME_BONUSES[ranks_advanced]
+            endgame_score += PASSED_PAWN_ENDGAME_BONUSES[ranks_advanced]
+        if not pawns & ADJACENT_FILE_MASKS[col]:
+            midgame_score -= ISOLATED_PAWN_PENALTY
+            endgame_score -= ISOLATED_PAWN_PENALTY
+            continue
+        support_mask = ADJACENT_FILE_MASKS[col] & ~(ROWS_ABOVE_MASKS[row] if white else ROWS_BELOW_MASKS[row])
+        guard_row = row - 2 if white else row + 2 # Opponent pawns there attack the square in front
+        if not pawns & support_mask and 0 <= guard_row < 8 and opponent_pawns & ADJACENT_FILE_MASKS[col] & ROW_MASKS[guard_row]:
+            midgame_score -= BACKWARD_PAWN_PENALTY
+            endgame_score -= BACKWARD_PAWN_PENALTY
+    return midgame_score, endgame_score, passed_pawns
+
+def evaluate_pawn_structure(white_pawns, black_pawns): # Midgame and endgame score from white's point of view and the passed pawns of both sides, only depends on the two pawn bitboards
+    white_midgame_score, white_endgame_score, white_passed_pawns = evaluate_pawns(white_pawns, black_pawns, True)
+    black_midgame_score, black_endgame_score, black_passed_pawns = evaluate_pawns(black_pawns, white_pawns, False)
+    return white_midgame_score - black_midgame_score, white_endgame_score - black_endgame_score, white_passed_pawns, black_passed_pawns
@@ -1,12 +1,13 @@
 import pygame
 import sys
+import threading
 from board import Board
-from mychess import Chess
+from mychess import Chess, Position, PIECE_CODES, KING_WHITE, KING_BLACK
 from engine import Engine
 
 class ChessGame:
     def __init__(self):
-        self.board_matrix = {
+        self.board_matrix = Position.from_board_matrix({
             "PAWN_BLACK": 0b00000000_00000000_00000000_00000000_00000000_00000000_11111111_00000000,
             "ROOK_BLACK": 0b00000000_00000000_00000000_00000000_00000000_00000000_00000000_10000001,
             "KNIGHT_BLACK": 0b00000000_00000000_00000000_00000000_00000000_00000000_00000000_01000010,
@@ -23,11 +24,15 @@ class ChessGame:
             "en_passant_position": 0,
             "last_capture_or_pawn_move": 0, 
             "all_pieces": 0b1111_1111_1111_1111_0000_0000_0000_0000_0000_0000_0000_0000_1111_1111_1111_1111
-        }
+        })
         self.white_turn = True
         self.check_position = None
         self.winner_positions = []
         self.move_counter = 0
+        self.engine_thread = None
+        self.engine_result = None
+        self.engine_thinking = False # The search runs on engine_thread, the main loop keeps handling events until it finishes
+        self.ponder_move = None # Expected reply of the player, searched on during their turn
         self.board = Board()
         self.chess = Chess(self.board)
         pygame.init()
@@ -35,13 +40,13 @@ class ChessGame:
         if self.singleplayer:
             self.player_color = self.board.color_selection()
             self.board_flip = True if self.player_color == "BLACK" else False
-            self.engine = Engine(self.chess, self.player_color)
+            self.engine = Engine(Chess(None), self.player_color) # Own Chess, its caches are used by the search thread only
         else:
             self.board_flip = False
             self.player_color = "WHITE"
 
     def start_game(self):
-        self.board.update_board(self.board_matrix, None, [], None, [], None, 0)
+        self.board.update_board(self.board_matrix.to_board_matrix(), None, [], None, [], None, 0)
         running = True
         displayed_selected_position = None
         origin_position = None
@@ -59,13 +64,20 @@ class ChessGame:
                     x, y = event.pos
                     
                     if (x < 800) and self.winner_positions == []:
-                        displayed_selected_position, possible_moves, origin_position = self.chess_interaction(x, y, possible_moves, origin_position)
+                        if not self.engine_thinking: # The board waits for the engine move
+                            displayed_selected_position, possible_moves, origin_position = self.chess_interaction(x, y, possible_moves, origin_position)
                     else: 
                         self.menu_iteraction((x, y))
 
-            self.board.update_board(self.board_matrix, displayed_selected_position, possible_moves, self.check_position, self.winner_positions, self.white_turn, self.move_counter)
+            if self.engine_thinking and not self.engine_thread.is_alive():
+                self.finish_engine_turn()
+
+            self.board.update_board(self.board_matrix.to_board_matrix(), displayed_selected_position, possible_moves, self.check_position, self.winner_positions, self.white_turn, self.move_counter)
             pygame.display.flip()
 
+        if self.singleplayer:
+            self.stop_engine_search()
+            self.engine.close()
         pygame.quit()
         sys.exit()
         
@@ -80,14 +92,17 @@ class ChessGame:
             calculation_selected_position = displayed_selected_position
         
         if calculation_selected_position in possible_moves:
-            self.chess.move_piece(origin_position, calculation_selected_position, self.board_matrix, None, self.move_counter)
+            player_move = self.chess.create_move(self.board_matrix, origin_position, calculation_selected_position, None)
+            self.chess.make_move(self.board_matrix, player_move)
             possible_moves = []
             calculation_selected_position = None
             displayed_selected_position = None
             self.end_turn()
             
             if self.singleplayer and self.winner_positions == []:
-                self.engine_turn()
+                self.engine_turn(player_move)
+            elif self.singleplayer:
+                self.stop_engine_search()
             
         elif self.chess.is_own_piece(calculation_selected_position, self.player_color, self.board_matrix):
             possible_moves = self.chess.calculate_possible_moves(self.board_matrix, calculation_selected_position)
@@ -97,17 +112,55 @@ class ChessGame:
         
         return displayed_selected_position, possible_moves, origin_position
     
-    def engine_turn(self):
-        self.board.update_board(self.board_matrix, None, [], self.check_position, self.winner_positions, self.white_turn, self.move_counter)
+    def engine_turn(self, player_move = None): # Starts the search, finish_engine_turn plays its move
+        self.board.update_board(self.board_matrix.to_board_matrix(), None, [], self.check_position, self.winner_positions, self.white_turn, self.move_counter)
         pygame.display.flip()
-        engine_from_position, engine_to_position = self.engine.calculate_move(self.board_matrix, self.move_counter)
-        self.chess.move_piece(engine_from_position, engine_to_position, self.board_matrix, "QUEEN", self.move_counter)
+        self.engine_thinking = True
+        if self.engine_thread is not None and player_move == self.ponder_move: # Ponder hit, the running search becomes the real one
+            self.engine.ponder_hit()
+        else:
+            self.stop_engine_search()
+            self.start_engine_search(self.board_matrix.copy(), self.move_counter, False)
+        self.ponder_move = None
+    
+    def finish_engine_turn(self):
+        self.engine_thread = None
+        self.engine_thinking = False
+        self.chess.make_move(self.board_matrix, self.engine_result)
         self.end_turn()
-        
+        if self.winner_positions == []:
+            self.start_pondering()
+    
+    def start_pondering(self):
+        engine_color = self.engine.engine_color
+        self.ponder_move = self.engine.get_ponder_move(self.board_matrix, self.player_color)
+        if self.ponder_move is None:
+            return
+        ponder_board_matrix = self.board_matrix.copy()
+        self.engine.chess.make_move(ponder_board_matrix, self.ponder_move)
+        if self.engine.chess.is_in_checkmate(engine_color == "WHITE", ponder_board_matrix) or self.engine.chess.is_stalemate(engine_color == "WHITE", ponder_board_matrix):
+            self.ponder_move = None # No move to search for
+            return
+        self.start_engine_search(ponder_board_matrix, self.move_counter + 1, True)
+    
+    def start_engine_search(self, board_matrix, move_counter, ponder):
+        self.engine.clear_stop()
+        self.engine_thread = threading.Thread(target = self.run_engine_search, args = (board_matrix, move_counter, ponder), daemon = True)
+        self.engine_thread.start()
+    
+    def run_engine_search(self, board_matrix, move_counter, ponder):
+        self.engine_result = self.engine.calculate_move(board_matrix, move_counter, ponder)
+    
+    def stop_engine_search(self): # Ends a running search and discards its move
+        if self.engine_thread is not None:
+            self.engine.stop_search()
+            self.engine_thread.join()
+            self.engine_thread = None
+    
     def end_turn(self):
         self.check_position = None
         self.chess.archive_board(self.board_matrix)
-        if self.chess.check_threefold_repetition() or self.chess.check_fifty_move_rule(self.move_counter, self.board_matrix):
+        if self.chess.check_threefold_repetition() or self.chess.check_fifty_move_rule(self.board_matrix):
             return
         
         self.move_counter += 1
@@ -119,16 +172,16 @@ class ChessGame:
         if self.chess.is_in_check(self.white_turn, self.board_matrix):
             if self.chess.is_in_checkmate(self.white_turn, self.board_matrix):
                 opponent_color = "BLACK" if self.white_turn else "WHITE"
-                self.winner_positions = [self.board_matrix["KING_" + opponent_color]]
+                self.winner_positions = [self.board_matrix.bitboards[PIECE_CODES["KING_" + opponent_color]]]
                 return
             else:
                 own_color = "WHITE" if self.white_turn else "BLACK"
-                self.check_position = self.board_matrix["KING_" + own_color]
+                self.check_position = self.board_matrix.bitboards[PIECE_CODES["KING_" + own_color]]
         elif self.chess.is_stalemate(self.white_turn, self.board_matrix):
             self.proclaim_draw()
             
     def proclaim_draw(self):
-        self.winner_positions = [self.board_matrix["KING_WHITE"], self.board_matrix["KING_BLACK"]]
+        self.winner_positions = [self.board_matrix.bitboards[KING_WHITE], self.board_matrix.bitboards[KING_BLACK]]
             
     def menu_iteraction(self, clicked_coordinates):
         x, y = clicked_coordinates
@@ -170,10 +223,10 @@ class ChessGame:
         archived_board = self.chess.get_archived_board(displayed_move)
         archived_check_position = None
         if self.chess.is_in_check(True, archived_board):
-            archived_check_position = archived_board["KING_WHITE"]
+            archived_check_position = archived_board.bitboards[KING_WHITE]
         elif self.chess.is_in_check(False, archived_board):
-            archived_check_position = archived_board["KING_BLACK"]
-        self.board.update_board(archived_board, None, [], archived_check_position, [], None, displayed_move)
+            archived_check_position = archived_board.bitboards[KING_BLACK]
+        self.board.update_board(archived_board.to_board_matrix(), None, [], archived_check_position, [], None, displayed_move)
         pygame.display.flip()
         
     def reverse_bits(self, n):
@@ -1,8 +1,13 @@
+import sys
 import math
+import random
 import functools
-from collections import Counter
+from collections import Counter, OrderedDict
+from evaluation import MIDGAME_PIECE_SQUARE_SCORES, ENDGAME_PIECE_SQUARE_SCORES, PHASE_WEIGHTS, EXCHANGE_PIECE_VALUES
 
 ALL_PAWNS_START_POS = 0b00000000_11111111_00000000_00000000_00000000_00000000_11111111_00000000
+WHITE_PAWNS_START_POS = 0b00000000_11111111_00000000_00000000_00000000_00000000_00000000_00000000
+BLACK_PAWNS_START_POS = 0b00000000_00000000_00000000_00000000_00000000_00000000_11111111_00000000
 ALL_PAWNS_MOVEDTWO_POS = 0b00000000_00000000_00000000_11111111_11111111_00000000_00000000_00000000
 ALL_PAWNS_LASTRANK_POS = 0b11111111_00000000_00000000_00000000_00000000_00000000_00000000_11111111
 WHITE_KING_START_POS = 0b00010000_00000000_00000000_00000000_00000000_00000000_00000000_00000000
@@ -27,17 +32,340 @@ BLACK_CAN_CASTLE_QUEENSIDE = 0b0_0_1_0
 BLACK_CAN_CASTLE_KINGSIDE = 0b0_0_0_1
 WHITE_CAN_CASTLE = 0b1_1_0_0
 BLACK_CAN_CASTLE = 0b0_0_1_1
+QUEENSIDE_CASTLE_POSITIONS = { # King start, king end, rook start, rook end
+    "WHITE": (WHITE_KING_START_POS, POS_C1, WHITE_ROOK_QUEENSIDE_POS, POS_D1),
+    "BLACK": (BLACK_KING_START_POS, POS_C8, BLACK_ROOK_QUEENSIDE_POS, POS_D8)
+}
+KINGSIDE_CASTLE_POSITIONS = {
+    "WHITE": (WHITE_KING_START_POS, POS_G1, WHITE_ROOK_KINGSIDE_POS, POS_F1),
+    "BLACK": (BLACK_KING_START_POS, POS_G8, BLACK_ROOK_KINGSIDE_POS, POS_F8)
+}
+PIECE_NAMES = ("PAWN_BLACK", "ROOK_BLACK", "KNIGHT_BLACK", "BISHOP_BLACK", "QUEEN_BLACK", "KING_BLACK", "PAWN_WHITE", "ROOK_WHITE", "KNIGHT_WHITE", "BISHOP_WHITE", "QUEEN_WHITE", "KING_WHITE") # Index is the piece code
+PIECE_CODES = {piece_name: piece_code for piece_code, piece_name in enumerate(PIECE_NAMES)}
+PAWN_BLACK, ROOK_BLACK, KNIGHT_BLACK, BISHOP_BLACK, QUEEN_BLACK, KING_BLACK, PAWN_WHITE, ROOK_WHITE, KNIGHT_WHITE, BISHOP_WHITE, QUEEN_WHITE, KING_WHITE = range(12)
+EMPTY = len(PIECE_NAMES) # Piece code of an empty square
+COLOR_CODES = {"BLACK": 0, "WHITE": 1} # Piece code // 6
+PIECE_IDENTITIES = tuple(tuple(piece_name.split("_")) for piece_name in PIECE_NAMES) + ((None, None),)
+PROMOTION_PIECE_TYPES = ("QUEEN", "ROOK", "BISHOP", "KNIGHT")
+FEN_PIECE_CODES = {char: piece_code for piece_code, char in enumerate("prnbqkPRNBQK")}
+POSSIBLE_MOVES_CACHE_MAX_ENTRIES = 200000
+
+MOVE_CAPTURE = 0b0_0_0_0_1 # Move flags, packed above the start and end square indices
+MOVE_DOUBLE_PUSH = 0b0_0_0_1_0
+MOVE_EN_PASSANT = 0b0_0_1_0_0
+MOVE_CASTLE = 0b0_1_0_0_0
+MOVE_PROMOTION = 0b1_0_0_0_0
+
+
+def encode_move(start_position, end_position, flags = 0, promotion_piece = 0): # Start index in bits 0-5, end index in bits 6-11, flags in bits 12-16, promotion piece code above
+    return (start_position.bit_length() - 1) | ((end_position.bit_length() - 1) << 6) | (flags << 12) | (promotion_piece << 17)
+
+def decode_move(move):
+    return 1 << (move & 63), 1 << ((move >> 6) & 63), (move >> 12) & 31, move >> 17
+
+def build_step_attacks(directions): # Attack bitboard per square index for pieces moving one step in each direction
+    attacks = []
+    for square_index in range(64):
+        row, col = divmod(square_index, 8)
+        attack = 0
+        for d_row, d_col in directions:
+            new_row, new_col = row + d_row, col + d_col
+            if 0 <= new_row < 8 and 0 <= new_col < 8:
+                attack |= 1 << (new_row * 8 + new_col)
+        attacks.append(attack)
+    return attacks
+
+def bitboard_to_positions(bitboard): # Split a bitboard into its single-bit positions
+    positions = []
+    while bitboard:
+        position = bitboard & -bitboard
+        positions.append(position)
+        bitboard ^= position
+    return positions
+
+def build_line_attacks(lines): # Per square index, an occupancy mask and attack lookup table for each line through the square
+    line_attacks = []
+    for square_index in range(64):
+        row, col = divmod(square_index, 8)
+        square_lines = []
+        for directions in lines:
+            occupancy_mask = 0
+            for d_row, d_col in directions:
+                new_row, new_col = row + d_row, col + d_col
+                while 0 <= new_row + d_row < 8 and 0 <= new_col + d_col < 8: # Edge squares never block anything behind them
+                    occupancy_mask |= 1 << (new_row * 8 + new_col)
+                    new_row, new_col = new_row + d_row, new_col + d_col
+            attack_table = {}
+            occupancy = 0
+            while True: # Enumerate every subset of the occupancy mask
+                attack = 0
+                for d_row, d_col in directions:
+                    new_row, new_col = row + d_row, col + d_col
+                    while 0 <= new_row < 8 and 0 <= new_col < 8:
+                        attack |= 1 << (new_row * 8 + new_col)
+                        if occupancy & (1 << (new_row * 8 + new_col)):
+                            break
+                        new_row, new_col = new_row + d_row, new_col + d_col
+                attack_table[occupancy] = attack
+                occupancy = (occupancy - occupancy_mask) & occupancy_mask
+                if occupancy == 0:
+                    break
+            square_lines.append((occupancy_mask, attack_table))
+        line_attacks.append(tuple(square_lines))
+    return line_attacks
+
+def rook_attacks(square_index, occupancy):
+    (rank_mask, rank_table), (file_mask, file_table) = ROOK_LINES[square_index]
+    return rank_table[occupancy & rank_mask] | file_table[occupancy & file_mask]
+
+def bishop_attacks(square_index, occupancy):
+    (diagonal_mask, diagonal_table), (anti_diagonal_mask, anti_diagonal_table) = BISHOP_LINES[square_index]
+    return diagonal_table[occupancy & diagonal_mask] | anti_diagonal_table[occupancy & anti_diagonal_mask]
+
+ROOK_LINES = build_line_attacks([[(0, -1), (0, 1)], [(-1, 0), (1, 0)]])
+BISHOP_LINES = build_line_attacks([[(-1, -1), (1, 1)], [(-1, 1), (1, -1)]])
+KNIGHT_ATTACKS = build_step_attacks([(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)])
+KING_ATTACKS = build_step_attacks([(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)])
+PAWN_ATTACKS = {
+    "WHITE": build_step_attacks([(-1, -1), (-1, 1)]),
+    "BLACK": build_step_attacks([(1, -1), (1, 1)])
+}
+FULL_BOARD = (1 << 64) - 1
+
+def build_between_table(): # Squares strictly between two square indices sharing a rank, file or diagonal, 0 otherwise
+    between = []
+    for square_index in range(64):
+        square_between = []
+        for other_index in range(64):
+            squares = 0
+            if square_index != other_index:
+                for line_attacks in (rook_attacks, bishop_attacks):
+                    if line_attacks(square_index, 0) & (1 << other_index):
+                        squares = line_attacks(square_index, 1 << other_index) & line_attacks(other_index, 1 << square_index)
+            square_between.append(squares)
+        between.append(square_between)
+    return between
+
+def piece_attacks(piece, square_index, occupancy): # Attack bitboard of a piece code standing on a square index
+    piece_type = piece % 6
+    if piece_type == PAWN_BLACK:
+        return PAWN_ATTACKS["WHITE" if piece == PAWN_WHITE else "BLACK"][square_index]
+    if piece_type == KNIGHT_BLACK:
+        return KNIGHT_ATTACKS[square_index]
+    if piece_type == KING_BLACK:
+        return KING_ATTACKS[square_index]
+    if piece_type == ROOK_BLACK:
+        return rook_attacks(square_index, occupancy)
+    if piece_type == BISHOP_BLACK:
+        return bishop_attacks(square_index, occupancy)
+    return rook_attacks(square_index, occupancy) | bishop_attacks(square_index, occupancy)
+
+BETWEEN = build_between_table()
+EXCHANGE_ATTACKER_ORDER = (PAWN_BLACK, KNIGHT_BLACK, BISHOP_BLACK, ROOK_BLACK, QUEEN_BLACK, KING_BLACK) # Least valuable attackers recapture first
+
+zobrist_random = random.Random(0x5EED) # Fixed seed so keys are the same in every process and can be stored
+ZOBRIST_PIECE_SQUARES = [[zobrist_random.getrandbits(64) for _ in range(64)] for _ in PIECE_NAMES] # Indexed by piece code, then square index
+ZOBRIST_WHITE_TURN = zobrist_random.getrandbits(64)
+ZOBRIST_CASTELING_RIGHTS = [zobrist_random.getrandbits(64) for _ in range(16)] # Indexed by the casteling rights bits
+ZOBRIST_EN_PASSANT_FILES = [zobrist_random.getrandbits(64) for _ in range(8)]
+
+def en_passant_zobrist_key(en_passant_position):
+    return ZOBRIST_EN_PASSANT_FILES[(en_passant_position.bit_length() - 1) % 8] if en_passant_position else 0
+
+
+class Position:
+    __slots__ = ("bitboards", "mailbox", "color_pieces", "all_pieces", "casteling_rights", "en_passant_position", "halfmove_clock", "white_turn", "zobrist_key", "midgame_score", "endgame_score", "phase")
+    
+    def __init__(self, bitboards, casteling_rights, en_passant_position = 0, halfmove_clock = 0, white_turn = True):
+        self.bitboards = bitboards # Indexed by piece code
+        self.casteling_rights = casteling_rights
+        self.en_passant_position = en_passant_position
+        self.halfmove_clock = halfmove_clock
+        self.white_turn = white_turn
+        self.mailbox = [EMPTY] * 64 # Piece code per square index
+        self.color_pieces = [0, 0] # Indexed by color code
+        self.all_pieces = 0
+        for piece_code, bitboard in enumerate(bitboards):
+            for position in bitboard_to_positions(bitboard):
+                self.mailbox[position.bit_length() - 1] = piece_code
+            self.color_pieces[piece_code // 6] |= bitboard
+            self.all_pieces |= bitboard
+        self.zobrist_key = self.calculate_zobrist_key()
+        self.midgame_score, self.endgame_score = self.calculate_piece_square_scores()
+        self.phase = self.calculate_phase()
+        
+    @classmethod
+    def from_board_matrix(cls, board_matrix, white_turn = True, move_counter = None):
+        halfmove_clock = 0
+        if move_counter is not None and board_matrix["last_capture_or_pawn_move"] is not None:
+            halfmove_clock = move_counter - board_matrix["last_capture_or_pawn_move"]
+        return cls([board_matrix[piece_name] for piece_name in PIECE_NAMES], board_matrix["casteling_rights"], board_matrix["en_passant_position"] or 0, halfmove_clock, white_turn)
+    
+    @classmethod
+    def from_fen(cls, fen): # Piece placement, side to move, casteling rights, en passant square and halfmove clock of a FEN string
+        fields = fen.split()
+        bitboards = [0] * len(PIECE_NAMES)
+        for row, rank in enumerate(fields[0].split("/")): # Rank 8 first, like the bit indices
+            col = 0
+            for char in rank:
+                if char.isdigit():
+                    col += int(char)
+                else:
+                    bitboards[FEN_PIECE_CODES[char]] |= 1 << (row * 8 + col)
+                    col += 1
+        casteling_rights = 0
+        for char, casteling_right in zip("QKqk", (WHITE_CAN_CASTLE_QUEENSIDE, WHITE_CAN_CASTLE_KINGSIDE, BLACK_CAN_CASTLE_QUEENSIDE, BLACK_CAN_CASTLE_KINGSIDE)):
+            if char in fields[2]:
+                casteling_rights |= casteling_right
+        en_passant_position = 0
+        if fields[3] != "-":
+            en_passant_position = 1 << ((8 - int(fields[3][1])) * 8 + ord(fields[3][0]) - ord("a"))
+        halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+        return cls(bitboards, casteling_rights, en_passant_position, halfmove_clock, fields[1] == "w")
+    
+    def to_board_matrix(self, move_counter = None):
+        board_matrix = dict(zip(PIECE_NAMES, self.bitboards))
+        board_matrix["casteling_rights"] = self.casteling_rights
+        board_matrix["en_passant_position"] = self.en_passant_position
+        board_matrix["last_capture_or_pawn_move"] = None if move_counter is None else move_counter - self.halfmove_clock
+        board_matrix["all_pieces"] = self.all_pieces
+        return board_matrix
+    
+    def copy(self):
+        position = Position.__new__(Position)
+        position.bitboards = self.bitboards.copy()
+        position.mailbox = self.mailbox.copy()
+        position.color_pieces = self.color_pieces.copy()
+        position.all_pieces = self.all_pieces
+        position.casteling_rights = self.casteling_rights
+        position.en_passant_position = self.en_passant_position
+        position.halfmove_clock = self.halfmove_clock
+        position.white_turn = self.white_turn
+        position.zobrist_key = self.zobrist_key
+        position.midgame_score = self.midgame_score
+        position.endgame_score = self.endgame_score
+        position.phase = self.phase
+        return position
+    
+    def hash_key(self): # The halfmove clock is left out so repeated positions share a key
+        return self.zobrist_key
+    
+    def calculate_zobrist_key(self): # From scratch, make_move keeps the key up to date incrementally
+        zobrist_key = ZOBRIST_CASTELING_RIGHTS[self.casteling_rights] ^ en_passant_zobrist_key(self.en_passant_position)
+        if self.white_turn:
+            zobrist_key ^= ZOBRIST_WHITE_TURN
+        for square_index, piece in enumerate(self.mailbox):
+            if piece != EMPTY:
+                zobrist_key ^= ZOBRIST_PIECE_SQUARES[piece][square_index]
+        return zobrist_key
+    
+    def calculate_piece_square_scores(self): # From scratch, put_piece and remove_piece keep both scores up to date
+        midgame_score = endgame_score = 0
+        for square_index, piece in enumerate(self.mailbox):
+            if piece != EMPTY:
+                midgame_score += MIDGAME_PIECE_SQUARE_SCORES[piece][square_index]
+                endgame_score += ENDGAME_PIECE_SQUARE_SCORES[piece][square_index]
+        return midgame_score, endgame_score
+    
+    def calculate_phase(self): # From scratch, put_piece and remove_piece keep it up to date
+        return sum(PHASE_WEIGHTS[piece] for piece in self.mailbox if piece != EMPTY)
+    
+    def put_piece(self, piece, position):
+        self.bitboards[piece] |= position
+        self.color_pieces[piece // 6] |= position
+        self.all_pieces |= position
+        self.mailbox[position.bit_length() - 1] = piece
+        self.zobrist_key ^= ZOBRIST_PIECE_SQUARES[piece][position.bit_length() - 1]
+        self.midgame_score += MIDGAME_PIECE_SQUARE_SCORES[piece][position.bit_length() - 1]
+        self.endgame_score += ENDGAME_PIECE_SQUARE_SCORES[piece][position.bit_length() - 1]
+        self.phase += PHASE_WEIGHTS[piece]
+        
+    def remove_piece(self, piece, position):
+        self.bitboards[piece] &= ~position
+        self.color_pieces[piece // 6] &= ~position
+        self.all_pieces &= ~position
+        self.mailbox[position.bit_length() - 1] = EMPTY
+        self.zobrist_key ^= ZOBRIST_PIECE_SQUARES[piece][position.bit_length() - 1]
+        self.midgame_score -= MIDGAME_PIECE_SQUARE_SCORES[piece][position.bit_length() - 1]
+        self.endgame_score -= ENDGAME_PIECE_SQUARE_SCORES[piece][position.bit_length() - 1]
+        self.phase -= PHASE_WEIGHTS[piece]
+
+
+class MoveUndo: # Everything make_move changed that unmake_move can't derive from the position
+    __slots__ = ("start_position", "end_position", "moved_piece", "captured_piece", "captured_position", "castle", "casteling_rights", "en_passant_position", "halfmove_clock", "zobrist_key")
+    
+    def __init__(self, start_position, end_position, moved_piece, board_matrix):
+        self.start_position = start_position
+        self.end_position = end_position
+        self.moved_piece = moved_piece
+        self.captured_piece = EMPTY
+        self.captured_position = 0
+        self.castle = None
+        self.casteling_rights = board_matrix.casteling_rights
+        self.en_passant_position = board_matrix.en_passant_position
+        self.halfmove_clock = board_matrix.halfmove_clock
+        self.zobrist_key = board_matrix.zobrist_key
+
+
+class LRUCache: # Bounded by an entry and/or an estimated byte budget, least recently used entries are evicted first
+    def __init__(self, max_entries = None, max_bytes = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # Key -> (value, size in bytes)
+        self.size_in_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+    
+    def put(self, key, value):
+        if key in self.entries:
+            self.size_in_bytes -= self.entries.pop(key)[1]
+        entry_size = self.estimate_size(key) + self.estimate_size(value) if self.max_bytes is not None else 0 # Sizes are only tracked with a byte budget
+        self.entries[key] = (value, entry_size)
+        self.size_in_bytes += entry_size
+        while self.entries and ((self.max_entries is not None and len(self.entries) > self.max_entries) or (self.max_bytes is not None and self.size_in_bytes > self.max_bytes)):
+            _, (_, evicted_size) = self.entries.popitem(last = False)
+            self.size_in_bytes -= evicted_size
+            self.evictions += 1
+    
+    def clear(self):
+        self.entries.clear()
+        self.size_in_bytes = 0
+    
+    def estimate_size(self, value): # Shallow size plus the size of the items of tuples and lists
+        size = sys.getsizeof(value)
+        if isinstance(value, (tuple, list)):
+            size += sum(sys.getsizeof(item) for item in value)
+        return size
+    
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {"entries": len(self.entries), "bytes": self.size_in_bytes, "hits": self.hits, "misses": self.misses, "evictions": self.evictions, "hit_rate": self.hits / lookups if lookups else 0.0}
 
 
 class Chess:
-    def __init__(self, board):
+    def __init__(self, board, possible_moves_cache_max_entries = POSSIBLE_MOVES_CACHE_MAX_ENTRIES, possible_moves_cache_max_bytes = None):
         self.board = board
         self.hash_board_archive = []
         self.board_archive = []
-        self.possible_moves_cache = {}
+        self.possible_moves_cache = LRUCache(possible_moves_cache_max_entries, possible_moves_cache_max_bytes)
+        self.legal_move_masks_key = None
+        self.legal_move_masks = None
     
     def is_empty_position(self, board_matrix, position):
-        return (board_matrix["all_pieces"] & position) == 0
+        return (board_matrix.all_pieces & position) == 0
     
     @functools.cache
     def square_to_position(self, square): # Convert a square (row, col) to a position (bit index)
@@ -48,177 +376,164 @@ class Chess:
         return int(math.log(position, 2) // 8), int(math.log(position, 2) % 8)
     
     def identify_piece(self, position, board_matrix):
-        if (board_matrix["all_pieces"] & position) == 0:
+        if (board_matrix.all_pieces & position) == 0:
             return None, None
-        for piece, piece_position in board_matrix.items():
-            if piece in ("casteling_rights", "en_passant_position", "last_capture_or_pawn_move", "all_pieces"):
-                continue
-            if (piece_position & position) == position:
-                return piece.split('_')
-        return None, None
+        return PIECE_IDENTITIES[board_matrix.mailbox[position.bit_length() - 1]]
 
     def calculate_possible_moves(self, board_matrix, position):
-        hashed_move = hash(str(board_matrix) + str(position))
-        if (hashed_move) in self.possible_moves_cache:
-            return self.possible_moves_cache[hashed_move]
+        hashed_move = (board_matrix.hash_key(), position)
+        filtered_moves = self.possible_moves_cache.get(hashed_move)
+        if filtered_moves is not None:
+            return filtered_moves
         
         piece_type, piece_color = self.identify_piece(position, board_matrix)
-        moves = []
-
-        if piece_type:
-            if piece_type == "PAWN":
-                moves += self.calculate_pawn_moves(piece_color, position, board_matrix)
-            elif piece_type == "ROOK":
-                moves += self.calculate_rook_moves(piece_color, position, board_matrix)
-            elif piece_type == "BISHOP":
-                moves += self.calculate_bishop_moves(piece_color, position, board_matrix)
-            elif piece_type == "KNIGHT":
-                moves += self.calculate_knight_moves(piece_color, position, board_matrix)
-            elif piece_type == "QUEEN":
-                moves += self.calculate_queen_moves(piece_color, position, board_matrix)
-            elif piece_type == "KING":
-                moves += self.calculate_king_moves(piece_color, position, board_matrix)
-        
-        filtered_moves = list(filter(lambda move: not self.move_will_cause_check(piece_color, board_matrix, position, move), moves))
-        self.possible_moves_cache[hashed_move] = filtered_moves
+        filtered_moves = self.calculate_legal_moves(piece_type, piece_color, position, board_matrix) if piece_type else []
+        self.possible_moves_cache.put(hashed_move, filtered_moves)
 
         return filtered_moves
-
-    def calculate_pawn_moves(self, piece_color, position, board_matrix, only_impact = False):
+    
+    def generate_moves(self, board_matrix, color): # Packed legal moves of every piece of the color
+        hashed_moves = (board_matrix.hash_key(), color)
+        moves = self.possible_moves_cache.get(hashed_moves)
+        if moves is not None:
+            return moves
         
         moves = []
-        direction = False if piece_color=="WHITE" else True
+        own_pieces = self.get_color_pieces(color, board_matrix)
+        for position in bitboard_to_positions(own_pieces):
+            piece_type = PIECE_IDENTITIES[board_matrix.mailbox[position.bit_length() - 1]][0]
+            for end_position in self.calculate_legal_moves(piece_type, color, position, board_matrix):
+                if piece_type == "ROOK" and end_position & own_pieces: # Casteling is generated once, as the king move onto its rook
+                    continue
+                if piece_type == "PAWN" and end_position & ALL_PAWNS_LASTRANK_POS:
+                    for promotion_piece_type in PROMOTION_PIECE_TYPES:
+                        moves.append(self.create_move(board_matrix, position, end_position, promotion_piece_type))
+                else:
+                    moves.append(self.create_move(board_matrix, position, end_position))
+        self.possible_moves_cache.put(hashed_moves, moves)
         
-        if only_impact:
-            for delta_col in [9, 7]:
-                capture_position = (position << delta_col) if direction else (position >> delta_col)
-                try:
-                    if abs(int(math.log(position,2))%8 - int(math.log(capture_position,2))%8) ==1:
-                        moves.append(capture_position)
-                except Exception as e:
-                    print(f"Error processing the move: {capture_position}  for the boardmatrix: {board_matrix}: {e}")
-                    break
-            return moves
+        return moves
+    
+    def calculate_legal_moves(self, piece_type, piece_color, position, board_matrix):
+        moves = []
+        
+        if piece_type == "PAWN":
+            moves += self.calculate_pawn_moves(piece_color, position, board_matrix)
+        elif piece_type == "ROOK":
+            moves += self.calculate_rook_moves(piece_color, position, board_matrix)
+        elif piece_type == "BISHOP":
+            moves += self.calculate_bishop_moves(piece_color, position, board_matrix)
+        elif piece_type == "KNIGHT":
+            moves += self.calculate_knight_moves(piece_color, position, board_matrix)
+        elif piece_type == "QUEEN":
+            moves += self.calculate_queen_moves(piece_color, position, board_matrix)
+        elif piece_type == "KING":
+            moves += self.calculate_king_moves(piece_color, position, board_matrix)
+        
+        filtered_moves = []
+        if moves:
+            check_mask, pin_rays, king_danger = self.get_legal_move_masks(piece_color, board_matrix)
+            legal_mask = ~king_danger if piece_type == "KING" else check_mask & pin_rays.get(position, FULL_BOARD)
+            own_pieces = self.get_color_pieces(piece_color, board_matrix)
+            for move in moves:
+                if move & own_pieces: # Casteling, can_castle_queenside and can_castle_kingside already checked the squares of the king
+                    filtered_moves.append(move)
+                elif piece_type == "PAWN" and move == board_matrix.en_passant_position: # En passant is verified by playing it, removing both pawns can expose the king along the rank
+                    if not self.move_will_cause_check(piece_color, board_matrix, position, move):
+                        filtered_moves.append(move)
+                elif move & legal_mask:
+                    filtered_moves.append(move)
+        
+        return filtered_moves
+    
+    def get_legal_move_masks(self, color, board_matrix):
+        key = (board_matrix.hash_key(), color)
+        if key != self.legal_move_masks_key:
+            self.legal_move_masks = self.calculate_legal_move_masks(color, board_matrix)
+            self.legal_move_masks_key = key
+        return self.legal_move_masks
+    
+    def calculate_legal_move_masks(self, color, board_matrix): # Check evasion mask, pin ray per pinned piece and squares the king can't step on
+        opponent_code = 1 - COLOR_CODES[color]
+        king_position = board_matrix.bitboards[PIECE_CODES["KING_" + color]]
+        king_index = king_position.bit_length() - 1
+        occupancy = board_matrix.all_pieces & ~king_position # Sliders see through the king so it can't step back along their line
+        
+        king_danger = 0
+        checkers = 0
+        for position in bitboard_to_positions(board_matrix.color_pieces[opponent_code]):
+            attacks = piece_attacks(board_matrix.mailbox[position.bit_length() - 1], position.bit_length() - 1, occupancy)
+            king_danger |= attacks
+            if attacks & king_position:
+                checkers |= position
+        
+        if checkers == 0:
+            check_mask = FULL_BOARD
+        elif checkers & (checkers - 1) == 0: # Single check can be captured or blocked
+            check_mask = checkers | BETWEEN[king_index][checkers.bit_length() - 1]
+        else: # Double check, only the king can move
+            check_mask = 0
         
-        for delta_col in [9, 7]:
-            capture_position = (position << delta_col) if direction else (position >> delta_col)
-            if (self.is_opponent_piece(capture_position, piece_color, board_matrix) or (board_matrix["en_passant_position"] == capture_position)) and (int(math.log(position,2))%8 - int(math.log(capture_position,2))%8) in (-1, 1):
-                moves.append(capture_position)
-                
+        pin_rays = {}
+        opponent_queens = board_matrix.bitboards[QUEEN_BLACK + 6 * opponent_code]
+        sliders = (board_matrix.bitboards[ROOK_BLACK + 6 * opponent_code] | opponent_queens) & rook_attacks(king_index, 0)
+        sliders |= (board_matrix.bitboards[BISHOP_BLACK + 6 * opponent_code] | opponent_queens) & bishop_attacks(king_index, 0)
+        for slider_position in bitboard_to_positions(sliders):
+            ray = BETWEEN[king_index][slider_position.bit_length() - 1]
+            blockers = ray & board_matrix.all_pieces
+            if blockers and blockers & (blockers - 1) == 0 and blockers & board_matrix.color_pieces[1 - opponent_code]:
+                pin_rays[blockers] = ray | slider_position
+        
+        return check_mask, pin_rays, king_danger
+
+    def calculate_pawn_moves(self, piece_color, position, board_matrix):
+        attacks = PAWN_ATTACKS[piece_color][position.bit_length() - 1]
+        opponent_color = "WHITE" if piece_color == "BLACK" else "BLACK"
+        moves = bitboard_to_positions(attacks & (self.get_color_pieces(opponent_color, board_matrix) | board_matrix.en_passant_position))
+        
+        direction = False if piece_color=="WHITE" else True
         forward_square = (position << 8) if direction else (position >> 8)
         if self.is_empty_position(board_matrix, forward_square):
             moves.append(forward_square)
-            if (ALL_PAWNS_START_POS | position) == ALL_PAWNS_START_POS:
+            if position & (WHITE_PAWNS_START_POS if piece_color == "WHITE" else BLACK_PAWNS_START_POS):
                 double_forward_position = (position << 16) if direction else (position >> 16)
                 if self.is_empty_position(board_matrix, double_forward_position):
                     moves.append(double_forward_position)
         return moves
 
-    def calculate_rook_moves(self, piece_color, position, board_matrix, only_impact = False):
-        moves = []
-        row, col = self.position_to_square(position)
-
-        directions = [(1, 0), (-1, 0), (0, 1), (0, -1)]
-
-        for d_row, d_col in directions:
-            for i in range(1, 8):
-                new_row, new_col = row + d_row * i, col + d_col * i
-                if 0 <= new_row < 8 and 0 <= new_col < 8:
-                    target_position = self.square_to_position((new_row, new_col))
-                    _, target_piece_color = self.identify_piece(target_position, board_matrix)
-                    if target_piece_color == None:
-                        moves.append(target_position)
-                    elif target_piece_color != piece_color:
-                        moves.append(target_position)
-                        break
-                    else:
-                        break
-                else:
-                    break
-                
-        if not only_impact: # Casteling squares not attacked when calculating impact
-            if position in (BLACK_ROOK_QUEENSIDE_POS, WHITE_ROOK_QUEENSIDE_POS) and self.can_castle_queenside(piece_color, board_matrix):
-                moves.append(WHITE_KING_START_POS if piece_color == "WHITE" else BLACK_KING_START_POS)
-            if position in (BLACK_ROOK_KINGSIDE_POS, WHITE_ROOK_KINGSIDE_POS) and self.can_castle_kingside(piece_color, board_matrix):
-                moves.append(WHITE_KING_START_POS if piece_color == "WHITE" else BLACK_KING_START_POS)
-                
+    def calculate_rook_moves(self, piece_color, position, board_matrix):
+        moves = bitboard_to_positions(rook_attacks(position.bit_length() - 1, board_matrix.all_pieces) & ~self.get_color_pieces(piece_color, board_matrix))
+        
+        if position in (BLACK_ROOK_QUEENSIDE_POS, WHITE_ROOK_QUEENSIDE_POS) and self.can_castle_queenside(piece_color, board_matrix):
+            moves.append(WHITE_KING_START_POS if piece_color == "WHITE" else BLACK_KING_START_POS)
+        if position in (BLACK_ROOK_KINGSIDE_POS, WHITE_ROOK_KINGSIDE_POS) and self.can_castle_kingside(piece_color, board_matrix):
+            moves.append(WHITE_KING_START_POS if piece_color == "WHITE" else BLACK_KING_START_POS)
         return moves
     
     def calculate_bishop_moves(self, piece_color, position, board_matrix):
-        moves = []
-        row, col = self.position_to_square(position)
-
-        directions = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
-
-        for dr, dc in directions:
-            r, c = row + dr, col + dc
-            while 0 <= r < 8 and 0 <= c < 8:
-                target_position = self.square_to_position((r, c))
-                _, target_piece_color = self.identify_piece(target_position, board_matrix)
-                if target_piece_color == None:
-                    moves.append(target_position)
-                elif target_piece_color != piece_color:
-                    moves.append(target_position)
-                    break
-                else:
-                    break
-                r += dr
-                c += dc
-
-        return moves
+        return bitboard_to_positions(bishop_attacks(position.bit_length() - 1, board_matrix.all_pieces) & ~self.get_color_pieces(piece_color, board_matrix))
 
     def calculate_knight_moves(self, piece_color, position, board_matrix):
-        moves = []
-        row, col = self.position_to_square(position)
-        
-        directions = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]
-
-        for dr, dc in directions:
-            r, c = row + dr, col + dc
-            if 0 <= r < 8 and 0 <= c < 8:
-                target_position = self.square_to_position((r, c))
-                _, target_piece_color = self.identify_piece(target_position, board_matrix)
-                if target_piece_color != piece_color:
-                    moves.append(target_position)
-
-        return moves
+        return bitboard_to_positions(KNIGHT_ATTACKS[position.bit_length() - 1] & ~self.get_color_pieces(piece_color, board_matrix))
     
     def calculate_queen_moves(self, piece_color, position, board_matrix):
-        moves = []
-        
-        moves += self.calculate_bishop_moves(piece_color, position, board_matrix)
-        moves += self.calculate_rook_moves(piece_color, position, board_matrix)
-        
-        return moves
+        square_index = position.bit_length() - 1
+        attacks = rook_attacks(square_index, board_matrix.all_pieces) | bishop_attacks(square_index, board_matrix.all_pieces)
+        return bitboard_to_positions(attacks & ~self.get_color_pieces(piece_color, board_matrix))
     
-    def calculate_king_moves(self, piece_color, position, board_matrix, only_impact = False):
-        moves = []
-        row, col = self.position_to_square(position)
-        opponent_color = "WHITE" if piece_color == "BLACK" else "BLACK"
-
-        directions = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+    def calculate_king_moves(self, piece_color, position, board_matrix):
+        moves = bitboard_to_positions(KING_ATTACKS[position.bit_length() - 1] & ~self.get_color_pieces(piece_color, board_matrix))
         
-        for dr, dc in directions:
-            r, c = row + dr, col + dc
-            if 0 <= r < 8 and 0 <= c < 8:
-                target_position = self.square_to_position((r, c))
-                _, target_piece_color = self.identify_piece(target_position, board_matrix)
-                if target_piece_color != piece_color:
-                    if only_impact or not self.is_position_attacked_by(opponent_color, target_position, board_matrix):
-                        moves.append(target_position)
-                        
-        if not only_impact: # Casteling squares not attacked when calculating impact
-            if position == WHITE_KING_START_POS and piece_color == "WHITE":
-                if self.can_castle_queenside(piece_color, board_matrix):
-                    moves.append(WHITE_ROOK_QUEENSIDE_POS)
-                if self.can_castle_kingside(piece_color, board_matrix):
-                    moves.append(WHITE_ROOK_KINGSIDE_POS)
-            elif position == BLACK_KING_START_POS and piece_color == "BLACK":
-                if self.can_castle_queenside(piece_color, board_matrix):
-                    moves.append(BLACK_ROOK_QUEENSIDE_POS)
-                if self.can_castle_kingside(piece_color, board_matrix):
-                    moves.append(BLACK_ROOK_KINGSIDE_POS)
-
+        if position == WHITE_KING_START_POS and piece_color == "WHITE":
+            if self.can_castle_queenside(piece_color, board_matrix):
+                moves.append(WHITE_ROOK_QUEENSIDE_POS)
+            if self.can_castle_kingside(piece_color, board_matrix):
+                moves.append(WHITE_ROOK_KINGSIDE_POS)
+        elif position == BLACK_KING_START_POS and piece_color == "BLACK":
+            if self.can_castle_queenside(piece_color, board_matrix):
+                moves.append(BLACK_ROOK_QUEENSIDE_POS)
+            if self.can_castle_kingside(piece_color, board_matrix):
+                moves.append(BLACK_ROOK_KINGSIDE_POS)
         return moves
 
     def is_opponent_piece(self, position, piece_color, board_matrix):
@@ -229,223 +544,277 @@ class Chess:
         _, other_piece_color = self.identify_piece(position, board_matrix)
         return other_piece_color == piece_color
     
-    def move_piece(self, start_position, end_position, board_matrix, promotion_piece_type = "QUEEN", move_counter = None):
-        moved_piece_type, moved_piece_color = self.identify_piece(start_position, board_matrix)
-        target_piece_type, target_piece_color = self.identify_piece(end_position, board_matrix)
+    def get_color_pieces(self, color, board_matrix):
+        return board_matrix.color_pieces[COLOR_CODES[color]]
+    
+    def move_piece(self, start_position, end_position, board_matrix, promotion_piece_type = "QUEEN"): # Returns the undo record of the move
+        return self.make_move(board_matrix, self.create_move(board_matrix, start_position, end_position, promotion_piece_type))
+    
+    def create_move(self, board_matrix, start_position, end_position, promotion_piece_type = "QUEEN"): # Pack a move given by its positions, asking the board for the promotion piece if no type is given
+        moved_piece = board_matrix.mailbox[start_position.bit_length() - 1]
+        target_piece = board_matrix.mailbox[end_position.bit_length() - 1]
+        moved_piece_type, moved_piece_color = PIECE_IDENTITIES[moved_piece]
+        flags = 0
+        promotion_piece = 0
         
-        is_interesting_move = target_piece_type in ("ROOK", "KNIGHT", "BISHOP", "QUEEN", "PAWN")
+        if target_piece != EMPTY and target_piece // 6 != moved_piece // 6:
+            flags |= MOVE_CAPTURE
         
-        if not target_piece_color in (None, moved_piece_color): # Clear the captured piece
-            board_matrix[target_piece_type + "_" + target_piece_color] &= ~(end_position) 
-            board_matrix["last_capture_or_pawn_move"] = move_counter
-
-        if moved_piece_type in ("KING", "ROOK"): # Casteling logic
+        if moved_piece_type in ("KING", "ROOK") and target_piece != EMPTY and target_piece // 6 == moved_piece // 6: # Casteling moves onto the own king or rook, a rook capturing on the far corner doesn't castle
             if (start_position in (WHITE_ROOK_QUEENSIDE_POS, WHITE_KING_START_POS, BLACK_ROOK_QUEENSIDE_POS, BLACK_KING_START_POS)) and (end_position in (WHITE_ROOK_QUEENSIDE_POS, WHITE_KING_START_POS, BLACK_ROOK_QUEENSIDE_POS, BLACK_KING_START_POS)) and self.can_castle_queenside(moved_piece_color, board_matrix):
-                self.perform_castle_queenside(moved_piece_color, board_matrix)
-                self.sum_pieces(board_matrix)
-                board_matrix["en_passant_position"] = 0
-                return False
+                flags |= MOVE_CASTLE
             elif (start_position in (WHITE_ROOK_KINGSIDE_POS, WHITE_KING_START_POS, BLACK_ROOK_KINGSIDE_POS, BLACK_KING_START_POS)) and (end_position in (WHITE_ROOK_KINGSIDE_POS, WHITE_KING_START_POS, BLACK_ROOK_KINGSIDE_POS, BLACK_KING_START_POS)) and self.can_castle_kingside(moved_piece_color, board_matrix):
-                self.perform_castle_kingside(moved_piece_color, board_matrix)
-                self.sum_pieces(board_matrix)
-                board_matrix["en_passant_position"] = 0
-                return False
-            self.update_casteling_rights(start_position, moved_piece_color, board_matrix)
+                flags |= MOVE_CASTLE
+        elif moved_piece_type == "PAWN":
+            if end_position == board_matrix.en_passant_position:
+                captured_position = (end_position << 8) if moved_piece_color == "WHITE" else (end_position >> 8)
+                if board_matrix.mailbox[captured_position.bit_length() - 1] == (PAWN_BLACK if moved_piece_color == "WHITE" else PAWN_WHITE):
+                    flags |= MOVE_EN_PASSANT | MOVE_CAPTURE
+            if (start_position | ALL_PAWNS_START_POS) == ALL_PAWNS_START_POS and (end_position | ALL_PAWNS_MOVEDTWO_POS) == ALL_PAWNS_MOVEDTWO_POS:
+                flags |= MOVE_DOUBLE_PUSH
+            if (end_position | ALL_PAWNS_LASTRANK_POS) == ALL_PAWNS_LASTRANK_POS:
+                if not promotion_piece_type:
+                    promotion_piece_type = self.board.get_promotion_piece(moved_piece_color)
+                flags |= MOVE_PROMOTION
+                promotion_piece = PIECE_CODES[promotion_piece_type + "_" + moved_piece_color]
         
-        if moved_piece_type == "PAWN":
-            board_matrix["last_capture_or_pawn_move"] = move_counter
-            if end_position == board_matrix["en_passant_position"]: # Remove pawn if en passant move
-                if moved_piece_color == "WHITE":
-                    board_matrix["PAWN_BLACK"] &= ~(end_position << 8)
-                else:
-                    board_matrix["PAWN_WHITE"] &= ~(end_position >> 8)
-            board_matrix["en_passant_position"] = None
-            if (start_position | ALL_PAWNS_START_POS) == ALL_PAWNS_START_POS and (end_position | ALL_PAWNS_MOVEDTWO_POS) == ALL_PAWNS_MOVEDTWO_POS: # Save en passant position if pawn moved 2 ranks
-                if moved_piece_color == "WHITE":
-                    board_matrix["en_passant_position"] = (start_position >> 8)
-                else:
-                    board_matrix["en_passant_position"] = (start_position << 8)
-            if (end_position | ALL_PAWNS_LASTRANK_POS) == ALL_PAWNS_LASTRANK_POS: # Promote pawn on last rank
-                self.pawn_promotion(start_position, end_position, board_matrix, moved_piece_color, promotion_piece_type)
-                board_matrix["en_passant_position"] = None
-                return False
-        else:
-            board_matrix["en_passant_position"] = None
-                
-        board_matrix[moved_piece_type + "_" + moved_piece_color] &= ~(start_position) # Clear the start position
-        board_matrix[moved_piece_type + "_" + moved_piece_color] |= (end_position) # Set the end position
+        return encode_move(start_position, end_position, flags, promotion_piece)
+    
+    def make_move(self, board_matrix, move):
+        start_position, end_position, flags, promotion_piece = decode_move(move)
+        moved_piece = board_matrix.mailbox[start_position.bit_length() - 1]
+        target_piece = board_matrix.mailbox[end_position.bit_length() - 1]
+        moved_piece_type, moved_piece_color = PIECE_IDENTITIES[moved_piece]
+        undo = MoveUndo(start_position, end_position, moved_piece, board_matrix)
+        
+        board_matrix.white_turn = not board_matrix.white_turn
+        board_matrix.halfmove_clock += 1
+        board_matrix.en_passant_position = 0
+        board_matrix.zobrist_key ^= ZOBRIST_WHITE_TURN ^ ZOBRIST_CASTELING_RIGHTS[undo.casteling_rights] ^ en_passant_zobrist_key(undo.en_passant_position)
+        
+        if target_piece != EMPTY and target_piece // 6 != moved_piece // 6: # Clear the captured piece
+            board_matrix.remove_piece(target_piece, end_position)
+            undo.captured_piece = target_piece
+            undo.captured_position = end_position
+            board_matrix.halfmove_clock = 0
+            if target_piece in (ROOK_WHITE, ROOK_BLACK): # A rook captured on its start square can't castle anymore
+                self.update_casteling_rights(end_position, PIECE_IDENTITIES[target_piece][1], board_matrix)
 
-        self.sum_pieces(board_matrix)
+        if flags & MOVE_CASTLE:
+            undo.castle = (QUEENSIDE_CASTLE_POSITIONS if (start_position | end_position) & (WHITE_ROOK_QUEENSIDE_POS | BLACK_ROOK_QUEENSIDE_POS) else KINGSIDE_CASTLE_POSITIONS)[moved_piece_color]
+            self.perform_castle(undo.castle, board_matrix)
+            board_matrix.casteling_rights &= ~(WHITE_CAN_CASTLE if moved_piece_color == "WHITE" else BLACK_CAN_CASTLE)
+        elif flags & MOVE_PROMOTION:
+            board_matrix.halfmove_clock = 0
+            self.pawn_promotion(start_position, end_position, board_matrix, moved_piece_color, promotion_piece)
+        else:
+            if moved_piece_type in ("KING", "ROOK"):
+                self.update_casteling_rights(start_position, moved_piece_color, board_matrix)
+            elif moved_piece_type == "PAWN":
+                board_matrix.halfmove_clock = 0
+                if flags & MOVE_EN_PASSANT: # Remove the pawn passed by
+                    captured_position = (end_position << 8) if moved_piece_color == "WHITE" else (end_position >> 8)
+                    captured_piece = PAWN_BLACK if moved_piece_color == "WHITE" else PAWN_WHITE
+                    board_matrix.remove_piece(captured_piece, captured_position)
+                    undo.captured_piece = captured_piece
+                    undo.captured_position = captured_position
+                if flags & MOVE_DOUBLE_PUSH: # Save en passant position
+                    board_matrix.en_passant_position = (start_position >> 8) if moved_piece_color == "WHITE" else (start_position << 8)
+            board_matrix.remove_piece(moved_piece, start_position)
+            board_matrix.put_piece(moved_piece, end_position)
         
-        return is_interesting_move
+        board_matrix.zobrist_key ^= ZOBRIST_CASTELING_RIGHTS[board_matrix.casteling_rights] ^ en_passant_zobrist_key(board_matrix.en_passant_position)
+        return undo
+    
+    def unmake_move(self, board_matrix, undo):
+        board_matrix.white_turn = not board_matrix.white_turn
+        board_matrix.casteling_rights = undo.casteling_rights
+        board_matrix.en_passant_position = undo.en_passant_position
+        board_matrix.halfmove_clock = undo.halfmove_clock
         
-    def is_position_attacked_by(self, color, position, board_matrix):
-        for position_factor in range(64):
-            lookup_position = (1 << position_factor)
-            lookup_piece_type, lookup_piece_color = self.identify_piece(lookup_position, board_matrix)
-            if color == lookup_piece_color:
-                if lookup_piece_type == "PAWN":
-                    if position in self.calculate_pawn_moves(lookup_piece_color, lookup_position, board_matrix, True):
-                        return True
-                if lookup_piece_type == "ROOK":
-                    if position in self.calculate_rook_moves(lookup_piece_color, lookup_position, board_matrix, True):
-                        return True
-                if lookup_piece_type == "BISHOP":
-                    if position in self.calculate_bishop_moves(lookup_piece_color, lookup_position, board_matrix):
-                        return True
-                if lookup_piece_type == "KNIGHT":
-                    if position in self.calculate_knight_moves(lookup_piece_color, lookup_position, board_matrix):
-                        return True
-                if lookup_piece_type == "QUEEN":
-                    if position in self.calculate_queen_moves(lookup_piece_color, lookup_position, board_matrix):
-                        return True
-                if lookup_piece_type == "KING":
-                    if position in self.calculate_king_moves(lookup_piece_color, lookup_position, board_matrix, True):
-                        return True
-                
-        return False
+        if undo.castle:
+            king_start_position, king_end_position, rook_start_position, rook_end_position = undo.castle
+            self.perform_castle((king_end_position, king_start_position, rook_end_position, rook_start_position), board_matrix)
+        else:
+            board_matrix.remove_piece(board_matrix.mailbox[undo.end_position.bit_length() - 1], undo.end_position)
+            board_matrix.put_piece(undo.moved_piece, undo.start_position)
+        if undo.captured_piece != EMPTY:
+            board_matrix.put_piece(undo.captured_piece, undo.captured_position)
+        board_matrix.zobrist_key = undo.zobrist_key
+    
+    def make_null_move(self, board_matrix): # Only pass the turn, returns what unmake_null_move needs
+        undo = (board_matrix.en_passant_position, board_matrix.zobrist_key)
+        board_matrix.white_turn = not board_matrix.white_turn
+        board_matrix.zobrist_key ^= ZOBRIST_WHITE_TURN ^ en_passant_zobrist_key(board_matrix.en_passant_position)
+        board_matrix.en_passant_position = 0
+        return undo
+    
+    def unmake_null_move(self, board_matrix, undo):
+        board_matrix.white_turn = not board_matrix.white_turn
+        board_matrix.en_passant_position, board_matrix.zobrist_key = undo
+        
+    def is_position_attacked_by(self, color, position, board_matrix): # Look outward from the target square for attackers of the given color
+        square_index = position.bit_length() - 1
+        bitboards = board_matrix.bitboards
+        color_offset = 6 * COLOR_CODES[color]
+        if KNIGHT_ATTACKS[square_index] & bitboards[KNIGHT_BLACK + color_offset]:
+            return True
+        if KING_ATTACKS[square_index] & bitboards[KING_BLACK + color_offset]:
+            return True
+        if PAWN_ATTACKS["BLACK" if color == "WHITE" else "WHITE"][square_index] & bitboards[PAWN_BLACK + color_offset]: # Pawns attack the square from where an opposite pawn would capture
+            return True
+        queens = bitboards[QUEEN_BLACK + color_offset]
+        if rook_attacks(square_index, board_matrix.all_pieces) & (bitboards[ROOK_BLACK + color_offset] | queens):
+            return True
+        return bool(bishop_attacks(square_index, board_matrix.all_pieces) & (bitboards[BISHOP_BLACK + color_offset] | queens))
+    
+    def attackers_of_square(self, square_index, occupancy, board_matrix): # Pieces of both colors attacking a square index, sliders only through the given occupancy
+        bitboards = board_matrix.bitboards
+        rooks_and_queens = bitboards[ROOK_BLACK] | bitboards[ROOK_WHITE] | bitboards[QUEEN_BLACK] | bitboards[QUEEN_WHITE]
+        bishops_and_queens = bitboards[BISHOP_BLACK] | bitboards[BISHOP_WHITE] | bitboards[QUEEN_BLACK] | bitboards[QUEEN_WHITE]
+        return ((KNIGHT_ATTACKS[square_index] & (bitboards[KNIGHT_BLACK] | bitboards[KNIGHT_WHITE]))
+                | (KING_ATTACKS[square_index] & (bitboards[KING_BLACK] | bitboards[KING_WHITE]))
+                | (PAWN_ATTACKS["WHITE"][square_index] & bitboards[PAWN_BLACK])
+                | (PAWN_ATTACKS["BLACK"][square_index] & bitboards[PAWN_WHITE])
+                | (rook_attacks(square_index, occupancy) & rooks_and_queens)
+                | (bishop_attacks(square_index, occupancy) & bishops_and_queens)) & occupancy
+    
+    def see(self, board_matrix, move): # Static exchange evaluation, material the moving side wins if both sides keep recapturing on the target square with their least valuable piece while it pays
+        start_index, end_index, flags = move & 63, (move >> 6) & 63, move >> 12 & 31
+        mailbox = board_matrix.mailbox
+        bitboards = board_matrix.bitboards
+        moved_piece = mailbox[start_index]
+        occupancy = board_matrix.all_pieces & ~(1 << start_index) # Only the occupancy changes, no move is played
+        if flags & MOVE_EN_PASSANT:
+            captured_index = end_index + 8 if moved_piece == PAWN_WHITE else end_index - 8
+            occupancy &= ~(1 << captured_index)
+            gains = [EXCHANGE_PIECE_VALUES[mailbox[captured_index]]]
+        else:
+            gains = [EXCHANGE_PIECE_VALUES[mailbox[end_index]]]
+        piece_on_square = moved_piece
+        if flags & MOVE_PROMOTION:
+            piece_on_square = move >> 17
+            gains[0] += EXCHANGE_PIECE_VALUES[piece_on_square] - EXCHANGE_PIECE_VALUES[moved_piece]
+        
+        attackers = self.attackers_of_square(end_index, occupancy, board_matrix)
+        color_code = 1 - moved_piece // 6
+        while True:
+            side_attackers = attackers & board_matrix.color_pieces[color_code]
+            if not side_attackers:
+                break
+            for piece_type in EXCHANGE_ATTACKER_ORDER:
+                piece_attackers = side_attackers & bitboards[piece_type + 6 * color_code]
+                if piece_attackers:
+                    break
+            if piece_type == KING_BLACK and attackers & board_matrix.color_pieces[1 - color_code]: # The king can't capture a defended piece
+                break
+            gains.append(EXCHANGE_PIECE_VALUES[piece_on_square] - gains[-1]) # Score of this capture if the other side stops afterwards
+            piece_on_square = piece_type + 6 * color_code
+            occupancy &= ~(piece_attackers & -piece_attackers)
+            attackers = self.attackers_of_square(end_index, occupancy, board_matrix) # Sliders behind the capturing piece join in (x-ray)
+            color_code = 1 - color_code
+        
+        for index in range(len(gains) - 1, 0, -1): # Either side may stop capturing when going on would lose material
+            gains[index - 1] = -max(-gains[index - 1], gains[index])
+        return gains[0]
     
     def move_will_cause_check(self, piece_color, board_matrix, start_position, end_position):
-        temp_board_matrix = board_matrix.copy()
-        self.move_piece(start_position, end_position, temp_board_matrix)
+        undo = self.make_move(board_matrix, self.create_move(board_matrix, start_position, end_position))
+        is_in_check = self.is_in_check(piece_color == "WHITE", board_matrix)
+        self.unmake_move(board_matrix, undo)
         
-        return self.is_in_check(piece_color == "WHITE", temp_board_matrix)
+        return is_in_check
     
     def is_in_check(self, white_turn, board_matrix):
         own_color = "WHITE" if white_turn else "BLACK"
         opponent_color = "BLACK" if white_turn else "WHITE"
         
-        return self.is_position_attacked_by(opponent_color, board_matrix["KING_" + own_color], board_matrix)
+        return self.is_position_attacked_by(opponent_color, board_matrix.bitboards[PIECE_CODES["KING_" + own_color]], board_matrix)
     
     def is_in_checkmate(self, white_turn, board_matrix):
-        own_color = "WHITE" if white_turn else "BLACK"
-        temp_board_matrix = board_matrix.copy()
-        if not self.is_in_check(white_turn, temp_board_matrix):
-            return False
-        for position_factor in range(64):
-            lookup_position = (1 << position_factor)
-            if self.is_own_piece(lookup_position, own_color, temp_board_matrix):
-                if self.calculate_possible_moves(temp_board_matrix, lookup_position) != []:
-                    return False
-        return True
+        return self.is_in_check(white_turn, board_matrix) and not self.generate_moves(board_matrix, "WHITE" if white_turn else "BLACK")
     
     def is_stalemate(self, white_turn, board_matrix):
-        own_color = "WHITE" if white_turn else "BLACK"
-        for position_factor in range(64):
-            lookup_position = (1 << position_factor)
-            if self.is_own_piece(lookup_position, own_color, board_matrix):
-                if self.calculate_possible_moves(board_matrix, lookup_position) != []:
-                    return False
-        return True
+        return not self.generate_moves(board_matrix, "WHITE" if white_turn else "BLACK")
     
     def can_castle_queenside(self, color, board_matrix):
         if color == "WHITE":
-            if not ((board_matrix["casteling_rights"] & WHITE_CAN_CASTLE_QUEENSIDE) == WHITE_CAN_CASTLE_QUEENSIDE):
+            if not ((board_matrix.casteling_rights & WHITE_CAN_CASTLE_QUEENSIDE) == WHITE_CAN_CASTLE_QUEENSIDE):
                 return False
             elif not (self.is_empty_position(board_matrix, POS_B1) and self.is_empty_position(board_matrix, POS_C1) and self.is_empty_position(board_matrix, POS_D1)):
                 return False
-            elif self.is_position_attacked_by("BLACK", POS_B1, board_matrix) or self.is_position_attacked_by("BLACK", POS_C1, board_matrix) or self.is_position_attacked_by("BLACK", POS_D1, board_matrix):
+            elif self.is_position_attacked_by("BLACK", WHITE_KING_START_POS, board_matrix) or self.is_position_attacked_by("BLACK", POS_C1, board_matrix) or self.is_position_attacked_by("BLACK", POS_D1, board_matrix): # The king can't castle out of or through check, the rook may pass an attacked square
                 return False
         else:
-            if not ((board_matrix["casteling_rights"] & BLACK_CAN_CASTLE_QUEENSIDE) == BLACK_CAN_CASTLE_QUEENSIDE):
+            if not ((board_matrix.casteling_rights & BLACK_CAN_CASTLE_QUEENSIDE) == BLACK_CAN_CASTLE_QUEENSIDE):
                 return False
             elif not (self.is_empty_position(board_matrix, POS_B8) and self.is_empty_position(board_matrix, POS_C8) and self.is_empty_position(board_matrix, POS_D8)):
                 return False
-            elif self.is_position_attacked_by("WHITE", POS_B8, board_matrix) or self.is_position_attacked_by("WHITE", POS_C8, board_matrix) or self.is_position_attacked_by("WHITE", POS_D8, board_matrix):
+            elif self.is_position_attacked_by("WHITE", BLACK_KING_START_POS, board_matrix) or self.is_position_attacked_by("WHITE", POS_C8, board_matrix) or self.is_position_attacked_by("WHITE", POS_D8, board_matrix): # The king can't castle out of or through check, the rook may pass an attacked square
                 return False
         return True
     
     def can_castle_kingside(self, color, board_matrix):
         if color == "WHITE":
-            if not ((board_matrix["casteling_rights"] & WHITE_CAN_CASTLE_KINGSIDE) == WHITE_CAN_CASTLE_KINGSIDE):
+            if not ((board_matrix.casteling_rights & WHITE_CAN_CASTLE_KINGSIDE) == WHITE_CAN_CASTLE_KINGSIDE):
                 return False
             elif not (self.is_empty_position(board_matrix, POS_F1) and self.is_empty_position(board_matrix, POS_G1)):
                 return False
-            elif self.is_position_attacked_by("BLACK", POS_F1, board_matrix) or self.is_position_attacked_by("BLACK", POS_G1, board_matrix):
+            elif self.is_position_attacked_by("BLACK", WHITE_KING_START_POS, board_matrix) or self.is_position_attacked_by("BLACK", POS_F1, board_matrix) or self.is_position_attacked_by("BLACK", POS_G1, board_matrix):
                 return False
         else:
-            if not ((board_matrix["casteling_rights"] & BLACK_CAN_CASTLE_KINGSIDE) == BLACK_CAN_CASTLE_KINGSIDE):
+            if not ((board_matrix.casteling_rights & BLACK_CAN_CASTLE_KINGSIDE) == BLACK_CAN_CASTLE_KINGSIDE):
                 return False
             elif not (self.is_empty_position(board_matrix, POS_F8) and self.is_empty_position(board_matrix, POS_G8)):
                 return False
-            elif self.is_position_attacked_by("WHITE", POS_F8, board_matrix) or self.is_position_attacked_by("WHITE", POS_G8, board_matrix):
+            elif self.is_position_attacked_by("WHITE", BLACK_KING_START_POS, board_matrix) or self.is_position_attacked_by("WHITE", POS_F8, board_matrix) or self.is_position_attacked_by("WHITE", POS_G8, board_matrix):
                 return False
         return True
     
     def update_casteling_rights(self, start_position, moved_piece_color, board_matrix):
         if moved_piece_color == "WHITE":
             if start_position == WHITE_KING_START_POS:
-                board_matrix["casteling_rights"] &= ~(WHITE_CAN_CASTLE)
+                board_matrix.casteling_rights &= ~(WHITE_CAN_CASTLE)
                 return
             elif start_position == 72057594037927936:
-                board_matrix["casteling_rights"] &= ~(WHITE_CAN_CASTLE_QUEENSIDE)
+                board_matrix.casteling_rights &= ~(WHITE_CAN_CASTLE_QUEENSIDE)
                 return
             elif start_position == 9223372036854775808:
-                board_matrix["casteling_rights"] &= ~(WHITE_CAN_CASTLE_KINGSIDE)
+                board_matrix.casteling_rights &= ~(WHITE_CAN_CASTLE_KINGSIDE)
                 return
         else:
             if start_position == BLACK_KING_START_POS:
-                board_matrix["casteling_rights"] &= ~(BLACK_CAN_CASTLE)
+                board_matrix.casteling_rights &= ~(BLACK_CAN_CASTLE)
                 return
             elif start_position == 1:
-                board_matrix["casteling_rights"] &= ~(BLACK_CAN_CASTLE_QUEENSIDE)
+                board_matrix.casteling_rights &= ~(BLACK_CAN_CASTLE_QUEENSIDE)
                 return
             elif start_position == 128:
-                board_matrix["casteling_rights"] &= ~(BLACK_CAN_CASTLE_KINGSIDE)
+                board_matrix.casteling_rights &= ~(BLACK_CAN_CASTLE_KINGSIDE)
                 return
             
-    def perform_castle_queenside(self, piece_color, board_matrix):
-        if piece_color == "WHITE":
-            board_matrix["KING_WHITE"] &= ~(WHITE_KING_START_POS)
-            board_matrix["KING_WHITE"] |= (POS_C1)
-            board_matrix["ROOK_WHITE"] &= ~(WHITE_ROOK_QUEENSIDE_POS)
-            board_matrix["ROOK_WHITE"] |= (POS_D1)
-            board_matrix["casteling_rights"] &= ~(WHITE_CAN_CASTLE)
-        else:
-            board_matrix["KING_BLACK"] &= ~(BLACK_KING_START_POS)
-            board_matrix["KING_BLACK"] |= (POS_C8)
-            board_matrix["ROOK_BLACK"] &= ~(BLACK_ROOK_QUEENSIDE_POS)
-            board_matrix["ROOK_BLACK"] |= (POS_D8)
-            board_matrix["casteling_rights"] &= ~(BLACK_CAN_CASTLE)
-    
-    def perform_castle_kingside(self, piece_color, board_matrix):
-        if piece_color == "WHITE":
-            board_matrix["KING_WHITE"] &= ~(WHITE_KING_START_POS)
-            board_matrix["KING_WHITE"] |= (POS_G1)
-            board_matrix["ROOK_WHITE"] &= ~(WHITE_ROOK_KINGSIDE_POS)
-            board_matrix["ROOK_WHITE"] |= (POS_F1)
-            board_matrix["casteling_rights"] &= ~(WHITE_CAN_CASTLE)
-        else:
-            board_matrix["KING_BLACK"] &= ~(BLACK_KING_START_POS)
-            board_matrix["KING_BLACK"] |= (POS_G8)
-            board_matrix["ROOK_BLACK"] &= ~(BLACK_ROOK_KINGSIDE_POS)
-            board_matrix["ROOK_BLACK"] |= (POS_F8)
-            board_matrix["casteling_rights"] &= ~(BLACK_CAN_CASTLE)
+    def perform_castle(self, castle_positions, board_matrix):
+        king_start_position, king_end_position, rook_start_position, rook_end_position = castle_positions
+        king = board_matrix.mailbox[king_start_position.bit_length() - 1]
+        rook = board_matrix.mailbox[rook_start_position.bit_length() - 1]
+        board_matrix.remove_piece(king, king_start_position)
+        board_matrix.remove_piece(rook, rook_start_position)
+        board_matrix.put_piece(king, king_end_position)
+        board_matrix.put_piece(rook, rook_end_position)
             
-    def pawn_promotion(self, start_position, end_position, board_matrix, moved_piece_color, promotion_piece_type):
-        if not promotion_piece_type:
-            promotion_piece_type = self.board.get_promotion_piece(moved_piece_color)
-        board_matrix["PAWN_" + moved_piece_color] &= ~(start_position)
-        board_matrix[promotion_piece_type + "_" + moved_piece_color] |= (end_position)
+    def pawn_promotion(self, start_position, end_position, board_matrix, moved_piece_color, promoted_piece):
+        board_matrix.remove_piece(PIECE_CODES["PAWN_" + moved_piece_color], start_position)
+        board_matrix.put_piece(promoted_piece, end_position)
         
     def archive_board(self, board_matrix):
         self.board_archive.append(board_matrix.copy())
-        self.hash_board_archive.append(hash(str(board_matrix)))
+        self.hash_board_archive.append(board_matrix.hash_key())
         
     def check_threefold_repetition(self):
         return Counter(self.hash_board_archive).most_common(1)[0][1] >= 3
     
-    def check_fifty_move_rule(self, move_counter, board_matrix):
-        return (move_counter - board_matrix["last_capture_or_pawn_move"]) >= 100
+    def check_fifty_move_rule(self, board_matrix):
+        return board_matrix.halfmove_clock >= 100
     
     def get_archived_board(self, move):
         return self.board_archive[move]
-    
-    def sum_pieces(self, board_matrix):
-        all_pieces = 0
-        for piece, piece_position in board_matrix.items():
-            if piece in ("casteling_rights", "en_passant_position", "last_capture_or_pawn_move", "all_pieces"):
-                continue
-            else:
-                all_pieces |= piece_position
-        board_matrix["all_pieces"] = all_pieces
\ No newline at end of file
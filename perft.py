@@ -0,0 +1,101 @@
+import sys
+import time
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from mychess import Chess, Position, PIECE_IDENTITIES
+
+PERFT_REPORT_PATH = "perft_report.json"
+
+PERFT_POSITIONS = [ # Name, FEN and the known node counts from depth 1 on
+    ("start", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", [20, 400, 8902, 197281]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039, 97862]),
+    ("endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238]),
+    ("promotions", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467]),
+    ("promotions_mirrored", "r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1", [6, 264, 9467]),
+    ("discovered_check", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379]),
+    ("middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", [46, 2079, 89890]),
+    ("castling_rights", "r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1", [26, 568, 13744]),
+]
+
+def create_chess(): # Without the possible moves cache, which would serve transposed positions instead of running the move generation
+    return Chess(None, possible_moves_cache_max_entries = 0)
+
+def legal_moves(chess, board_matrix): # Packed moves of the side to move, one per promotion piece
+    return chess.generate_moves(board_matrix, "WHITE" if board_matrix.white_turn else "BLACK")
+
+def perft(chess, board_matrix, depth): # Number of leaf positions depth plies below the position
+    moves = legal_moves(chess, board_matrix)
+    if depth == 1: # The leaves don't have to be played
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        undo = chess.make_move(board_matrix, move)
+        nodes += perft(chess, board_matrix, depth - 1)
+        chess.unmake_move(board_matrix, undo)
+    return nodes
+
+def move_to_uci(move):
+    start_index, end_index = move & 63, (move >> 6) & 63
+    text = "abcdefgh"[start_index % 8] + str(8 - start_index // 8) + "abcdefgh"[end_index % 8] + str(8 - end_index // 8)
+    if move >> 17:
+        promotion_piece_type = PIECE_IDENTITIES[move >> 17][0]
+        text += "n" if promotion_piece_type == "KNIGHT" else promotion_piece_type[0].lower()
+    return text
+
+def perft_move_task(fen, move, depth): # Runs in a worker process, nodes below one root move
+    chess = create_chess()
+    board_matrix = Position.from_fen(fen)
+    chess.make_move(board_matrix, move)
+    return perft(chess, board_matrix, depth - 1) if depth > 1 else 1
+
+def divide(fen, depth, executor = None): # Node count per root move
+    chess = create_chess()
+    board_matrix = Position.from_fen(fen)
+    moves = legal_moves(chess, board_matrix)
+    if executor is not None:
+        counts = list(executor.map(perft_move_task, [fen] * len(moves), moves, [depth] * len(moves)))
+    else:
+        counts = [perft_move_task(fen, move, depth) for move in moves]
+    return {move_to_uci(move): count for move, count in zip(moves, counts)}
+
+def run_suite(max_depth, executor = None, report_path = PERFT_REPORT_PATH): # Returns the number of diverging counts
+    report = []
+    failures = 0
+    for name, fen, expected_counts in PERFT_POSITIONS:
+        for depth, expected_nodes in enumerate(expected_counts[:max_depth], 1):
+            timestamp = time.time()
+            nodes = sum(divide(fen, depth, executor).values())
+            seconds = time.time() - timestamp
+            passed = nodes == expected_nodes
+            failures += not passed
+            report.append({"name": name, "fen": fen, "depth": depth, "nodes": nodes, "expected": expected_nodes, "passed": passed, "seconds": round(seconds, 3), "nps": round(nodes / seconds) if seconds else None})
+            print(f"{name} depth {depth}: {nodes} nodes, expected {expected_nodes}, {'ok' if passed else 'FAILED'}, {seconds:.2f}s, {report[-1]['nps']} nps")
+
+    with open(report_path, 'w') as file:
+        json.dump(report, file, indent=4)
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Count the leaf positions of the move generator and compare them with known values.")
+    parser.add_argument("--depth", type = int, default = 3, help = "Deepest depth run for each position of the suite")
+    parser.add_argument("--divide", metavar = "FEN", help = "Print the node count per root move of this position instead of running the suite")
+    parser.add_argument("--processes", type = int, default = 0, help = "Split the root moves over this many processes")
+    parser.add_argument("--report", default = PERFT_REPORT_PATH, help = "Path of the JSON report with nodes per second per position")
+    args = parser.parse_args()
+
+    executor = ProcessPoolExecutor(args.processes) if args.processes else None
+    try:
+        if args.divide:
+            counts = divide(args.divide, args.depth, executor)
+            for uci_move, count in sorted(counts.items()):
+                print(f"{uci_move}: {count}")
+            print(f"Moves: {len(counts)}, nodes: {sum(counts.values())}")
+            failures = 0
+        else:
+            failures = run_suite(args.depth, executor, args.report)
+            print(f"{failures} diverging counts")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    sys.exit(1 if failures else 0)
@@ -3,7 +3,7 @@ import chess.pgn
 import re
 import pathlib
 import time
-from mychess import Chess
+from mychess import Chess, Position
 
 def get_data(pgn_file):
     game_count = 0
@@ -67,33 +67,29 @@ def process_games(games_list):
         "last_capture_or_pawn_move": 0, 
         "all_pieces": -281474976645121
     }
+    initial_position = Position.from_board_matrix(initial_board_matrix)
     
     for game in games_list:
-        board_matrix = initial_board_matrix.copy()
+        board_matrix = initial_position.copy()
         white_turn = True
 
         for move_num in range(min(10, len(game))):
             try:
                 move = game[move_num]
-                key = ""
-                for piece_type, piece_position in board_matrix.items():
-                    if piece_type in ("en_passant_position", "last_capture_or_pawn_move"):
-                        continue
-                    else:
-                        key += str(piece_position)
+                key = str(board_matrix.zobrist_key)
                 #print(f"looking at move: {move} on board_matrix: {board_matrix} with the key: {key}")
                         
                 from_position, to_position = parse_move_to_bit(move, chess, board_matrix, white_turn)
 
                 if from_position is None or to_position is None:
-                    print(f"Skipping move {move} in game {game} due to parsing error. white_turn: {white_turn}, Board: {str(board_matrix)}")
+                    print(f"Skipping move {move} in game {game} due to parsing error. white_turn: {white_turn}, Board: {board_matrix.to_board_matrix()}")
                     number_of_skipped_games += 1
                     break
                 
                 if to_position in chess.calculate_possible_moves(board_matrix, from_position):
                     chess.move_piece(from_position, to_position, board_matrix)
                 else: 
-                    print(f"Invalid move detected! Tried {move} on board = {board_matrix}")
+                    print(f"Invalid move detected! Tried {move} on board = {board_matrix.to_board_matrix()}")
                     break
 
                 number_of_processed_moves += 1
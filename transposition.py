@@ -0,0 +1,101 @@
+import struct
+from array import array
+from multiprocessing import shared_memory
+
+TRANSPOSITION_TABLE_SIZE = 1 << 18 # Entries, rounded down to a power of two
+
+EXACT = 0
+LOWER_BOUND = 1 # Search failed high, the score is at least this
+UPPER_BOUND = 2 # Search failed low, the score is at most this
+
+class TranspositionTable: # Preallocated parallel arrays indexed by the low bits of the Zobrist key
+    def __init__(self, size = TRANSPOSITION_TABLE_SIZE):
+        self.size = 1 << (size.bit_length() - 1)
+        self.index_mask = self.size - 1
+        self.keys = array("Q", bytes(8 * self.size))
+        self.scores = array("d", bytes(8 * self.size))
+        self.best_moves = array("q", bytes(8 * self.size))
+        self.depths = array("b", bytes(self.size))
+        self.bounds = array("B", bytes(self.size))
+        self.generations = array("B", bytes(self.size)) # 0 marks an empty slot
+        self.generation = 1
+        self.probes = 0
+        self.hits = 0
+
+    def new_search(self): # Entries of earlier searches stay usable but are replaced first
+        self.generation = self.generation % 255 + 1
+
+    def probe(self, key):
+        self.probes += 1
+        index = key & self.index_mask
+        if self.generations[index] and self.keys[index] == key:
+            self.hits += 1
+            return self.depths[index], self.scores[index], self.bounds[index], self.best_moves[index]
+        return None
+
+    def store(self, key, depth, score, bound, best_move):
+        index = key & self.index_mask
+        if self.generations[index] == self.generation and depth < self.depths[index]: # Depth-preferred within the current search
+            return
+        self.keys[index] = key
+        self.depths[index] = depth
+        self.scores[index] = score
+        self.bounds[index] = bound
+        self.best_moves[index] = best_move
+        self.generations[index] = self.generation
+
+    def clear(self):
+        self.generations = array("B", bytes(self.size))
+        self.generation = 1
+
+SHARED_ENTRY = struct.Struct("<QQq") # Key XOR the other two words, packed data, score in hundredths
+SHARED_SCORE_SCALE = 100 # Scores are kept to two decimals
+WORD_MASK = (1 << 64) - 1
+
+class SharedTranspositionTable: # Same interface, entries live in shared memory so several processes search with one table
+    def __init__(self, size = TRANSPOSITION_TABLE_SIZE, name = None): # Creates the memory without a name, attaches to it with one
+        self.size = 1 << (size.bit_length() - 1)
+        self.index_mask = self.size - 1
+        self.owner = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(create = True, size = SHARED_ENTRY.size * self.size)
+            self.memory.buf[:SHARED_ENTRY.size * self.size] = bytes(SHARED_ENTRY.size * self.size)
+        else:
+            self.memory = shared_memory.SharedMemory(name = name)
+        self.name = self.memory.name
+        self.buffer = self.memory.buf
+        self.generation = 1
+        self.probes = 0
+        self.hits = 0
+
+    def new_search(self):
+        self.generation = self.generation % 255 + 1
+
+    def probe(self, key): # No locks, an entry torn by a concurrent store fails the XOR check and reads as a miss
+        self.probes += 1
+        check, data, score = SHARED_ENTRY.unpack_from(self.buffer, (key & self.index_mask) * SHARED_ENTRY.size)
+        if (data >> 40) & 0xFF == 0 or check ^ data ^ (score & WORD_MASK) != key:
+            return None
+        self.hits += 1
+        depth = (data >> 24) & 0xFF
+        return depth - 256 if depth > 127 else depth, score / SHARED_SCORE_SCALE, (data >> 32) & 0xFF, data & 0xFFFFFF
+
+    def store(self, key, depth, score, bound, best_move):
+        offset = (key & self.index_mask) * SHARED_ENTRY.size
+        _, stored_data, _ = SHARED_ENTRY.unpack_from(self.buffer, offset)
+        stored_depth = (stored_data >> 24) & 0xFF
+        if (stored_data >> 40) & 0xFF == self.generation and depth < (stored_depth - 256 if stored_depth > 127 else stored_depth): # Depth-preferred within the current search
+            return
+        data = best_move | ((depth & 0xFF) << 24) | (bound << 32) | (self.generation << 40)
+        score = round(score * SHARED_SCORE_SCALE)
+        SHARED_ENTRY.pack_into(self.buffer, offset, key ^ data ^ (score & WORD_MASK), data, score)
+
+    def clear(self):
+        self.buffer[:SHARED_ENTRY.size * self.size] = bytes(SHARED_ENTRY.size * self.size)
+        self.generation = 1
+
+    def close(self): # The creating process also frees the memory
+        self.buffer.release()
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()